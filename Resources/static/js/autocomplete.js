@@ -0,0 +1,13 @@
+//suggest listing names as the search is typed
+const itemName = document.getElementById("item_name");
+const suggestions = document.getElementById("item_name_suggestions");
+itemName.addEventListener("input", async () => {
+    const prefix = itemName.value;
+    const response = await fetch("/autocomplete?prefix=" + encodeURIComponent(prefix));
+    if (!response.ok || itemName.value !== prefix) {
+        return;
+    }
+
+    const result = await response.json();
+    suggestions.replaceChildren(...result.names.map(name => new Option(name)));
+});
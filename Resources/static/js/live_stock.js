@@ -0,0 +1,26 @@
+//keep stock levels up to date without reloading the page
+const itemCategory = Number(document.currentScript.dataset.itemCategory);
+const itemManufacturer = Number(document.currentScript.dataset.itemManufacturer);
+const changes = new EventSource("/changes?item_category=" + itemCategory + "&item_manufacturer=" + itemManufacturer);
+changes.onmessage = (message) => {
+    const change = JSON.parse(message.data);
+    if (change.op === "reset") {
+        changes.close();
+        location.reload();
+        return;
+    }
+
+    const listing = document.getElementById("listing-" + change.id);
+    if (listing === null) {
+        return;
+    }
+
+    //listings which no longer match the search are taken off the page
+    const movedOut = (itemCategory !== -1 && change.category !== itemCategory)
+        || (itemManufacturer !== -1 && change.manufacturer !== itemManufacturer);
+    if (change.op === "removed" || movedOut) {
+        listing.remove();
+    } else {
+        listing.querySelector(".stock").textContent = change.quantity;
+    }
+};
@@ -0,0 +1,6 @@
+cd Scripts
+call activate.bat
+cd ..
+set PYTHONPATH=src
+python -m benchmarks.loadtest %*
+pause
@@ -0,0 +1,43 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from listingmanager.durability import Durability
+from listingmanager.listingmanager import _ListingManagerInstance
+
+
+def measure(mode, listing_count, mutations):
+    with tempfile.TemporaryDirectory() as directory:
+        manifest_path = os.path.join(directory, "manifest.json")
+        with open(manifest_path, "w") as f:
+            json.dump({"listings" : [], "next_id" : 0}, f)
+
+        manager = _ListingManagerInstance(manifest_path, durability=mode)
+        for i in range(listing_count):
+            manager.create_listing(f"Stock item {i}", "N/A", 0, 0)
+
+        #alternate additions and removals, as goods in and goods out would
+        start = time.perf_counter()
+        for i in range(mutations):
+            manager.add_stock(i % listing_count, 1 if i % 2 == 0 else -1)
+        manager.flush()
+        elapsed = time.perf_counter() - start
+
+    print(f"{mode:<10} {mutations / elapsed:10.0f} stock changes/s ({elapsed * 1000 / mutations:.3f}ms each)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+                    prog='Durability benchmark',
+                    description='Measures the throughput of stock changes when writes are synced to disk in each durability mode.',
+                    )
+    parser.add_argument("--listings", type=int, default=100)
+    parser.add_argument("--mutations", type=int, default=2000)
+    parser.add_argument("--modes", nargs="+", default=list(Durability.MODES), choices=Durability.MODES)
+    args = parser.parse_args()
+
+    #each stock change writes the listing's file, a change log entry, and a stock history record
+    for mode in args.modes:
+        measure(mode, args.listings, args.mutations)
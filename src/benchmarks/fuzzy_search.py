@@ -0,0 +1,80 @@
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from listingmanager import Listing
+from listingmanager.listingmanager import _ListingManagerInstance
+
+
+PARTS = ["Resistor", "Capacitor", "Inductor", "Header", "Socket", "Screw", "Washer", "Cable", "Fuse", "Diode", "Transistor", "Relay"]
+PACKAGES = ["0402", "0603", "0805", "1206", "TO-220", "SOT-23", "DIP-8", "M3", "M4", "M5"]
+VALUES = ["10k", "4k7", "100n", "10u", "1A", "2A", "12V", "24V", "6mm", "12mm", "30cm", "1m"]
+
+
+def generate_names(count, rng):
+    names = set()
+    while len(names) < count:
+        names.add(f"{rng.choice(PARTS)} {rng.choice(VALUES)} {rng.choice(PACKAGES)} #{rng.randint(0, count)}")
+    return list(names)
+
+def misspell(name, rng):
+    #swap two neighbouring letters in the first word, as a hurried typist might
+    word = name.split(" ")[0]
+    i = rng.randint(1, len(word) - 2)
+    return word[:i] + word[i + 1] + word[i] + word[i + 2:] + " " + " ".join(name.split(" ")[1:3])
+
+def percentile(sorted_values, fraction):
+    return sorted_values[max(0, min(len(sorted_values) - 1, int(fraction * len(sorted_values))))]
+
+def build_manager(directory, names):
+    #an empty catalog, with the listings added in memory. writing a file for each would take far longer
+    manifest_path = os.path.join(directory, "manifest.json")
+    with open(manifest_path, "w") as f:
+        json.dump({"listings" : [], "next_id" : 0}, f)
+
+    manager = _ListingManagerInstance(manifest_path)
+    for i, name in enumerate(names):
+        manager.append_listing(Listing(name, "", i % 12, i % 40, 0, id=i))
+    manager.load_pending()
+    return manager
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+                    prog='Fuzzy search benchmark',
+                    description='Measures the latency of typo-tolerant searches over a large generated catalog.',
+                    )
+    parser.add_argument("--listings", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--min-similarity", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    names = generate_names(args.listings, rng)
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        manager = build_manager(directory, names)
+        print(f"Indexed {args.listings} listings in {time.perf_counter() - start:.2f}s")
+
+        #the first page of results with their facets, as the search page asks for them. one
+        #extra result is asked for to find out if there is another page
+        latencies = []
+        found = 0
+        for _ in range(args.queries):
+            target = rng.choice(names)
+            query = misspell(target, rng)
+
+            start = time.perf_counter()
+            results, facets = manager.query_listings_with_facets(query, -1, -1, offset=0, limit=args.page_size + 1, fuzzy=True)
+            latencies.append(time.perf_counter() - start)
+            found += len(results) > 0
+
+    latencies.sort()
+    print(f"{args.queries} misspelt searches, {found} with results")
+    print(f"p50 {percentile(latencies, 0.50) * 1000:.2f}ms, p95 {percentile(latencies, 0.95) * 1000:.2f}ms, p99 {percentile(latencies, 0.99) * 1000:.2f}ms")
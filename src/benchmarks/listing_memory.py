@@ -0,0 +1,54 @@
+import argparse
+import gc
+import time
+import tracemalloc
+
+from listingmanager import Listing
+
+
+class DictListing:
+    #a listing as it was before slots, with a dict for every instance
+    def __init__(self, name, description, category, manufacturer, quantity, reorder_threshold = None, id = None):
+        self.name = name.strip()
+        self.description = description
+        self.manufacturer = manufacturer
+        self.quantity = quantity
+        self.category = category
+        self.reorder_threshold = reorder_threshold
+        self.id = id
+
+
+def generate_data(count):
+    return [
+        {"name" : f"Stock item {i}", "description" : "N/A", "category" : i % 12, "manufacturer" : i % 40, "quantity" : i % 100, "id" : i}
+        for i in range(count)
+    ]
+
+def measure(label, build, data):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    listings = [build(entry) for entry in data]
+    elapsed = time.perf_counter() - start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    #the list holding them is the same size for every kind of listing, so leave it out
+    per_listing = (size - listings.__sizeof__()) / len(data)
+    print(f"{label:<24} {per_listing:8.1f} bytes per listing, built in {elapsed:.2f}s")
+    del listings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+                    prog='Listing memory benchmark',
+                    description='Measures the memory used by, and time taken to build, a large number of listings.',
+                    )
+    parser.add_argument("--listings", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    data = generate_data(args.listings)
+    print(f"{args.listings} listings")
+    measure("Dict per instance", lambda entry: DictListing(**entry), data)
+    measure("Slotted", lambda entry: Listing(**entry), data)
+    measure("Slotted, trusted", lambda entry: Listing.from_dict(entry, trusted=True), data)
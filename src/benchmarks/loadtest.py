@@ -0,0 +1,207 @@
+import argparse
+import asyncio
+import configparser
+import json
+import math
+import os
+import random
+import tempfile
+import time
+
+from aiohttp.test_utils import TestServer, TestClient
+
+from website import Website
+from listingmanager import Listing, ListingManager
+
+
+#relative weights of each kind of request issued by the load generator
+DEFAULT_MIX = "search_results=60,search=10,add_stock=10,stock_added=10,stock_removed=10"
+
+CATEGORIES = ["Resistors", "Capacitors", "Inductors", "Connectors", "Tools"]
+MANUFACTURERS = ["Example company ltd.", "Totally real inc.", "Definitely exists co."]
+NAME_WORDS = ["Resistor", "Capacitor", "Header", "Socket", "Screw", "Washer", "Cable", "Fuse"]
+
+
+def build_catalog(directory, listing_count, rng):
+    #write a catalog in the same on-disk format as the real one, bypassing the
+    #manager so large catalogs can be generated quickly
+    categories_path = os.path.join(directory, "categories.txt")
+    manufacturers_path = os.path.join(directory, "manufacturers.txt")
+    manifest_path = os.path.join(directory, "manifest.json")
+
+    with open(categories_path, "w") as f:
+        f.write("\n".join(CATEGORIES))
+    with open(manufacturers_path, "w") as f:
+        f.write("\n".join(MANUFACTURERS))
+
+    names = []
+    manifest = {"listings" : [], "next_id" : listing_count}
+    for i in range(listing_count):
+        name = f"{rng.choice(NAME_WORDS)} {i:07d}"
+        listing = Listing(
+            name, 
+            f"Generated listing {i}", 
+            rng.randint(0, len(CATEGORIES)), 
+            rng.randint(0, len(MANUFACTURERS)), 
+            1_000_000, #large enough that removals never fail
+            id = i
+        )
+
+        filename = f"{i}.json"
+        with open(os.path.join(directory, filename), "w") as f:
+            json.dump(listing.as_dict(), f)
+        manifest["listings"].append(filename)
+        names.append(name)
+
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f)
+
+    config = configparser.ConfigParser()
+    config.add_section("Listings")
+    config["Listings"]["ManifestPath"] = manifest_path
+    config["Listings"]["CategoriesPath"] = categories_path
+    config["Listings"]["ManufacturersPath"] = manufacturers_path
+    return config, names
+
+
+def parse_mix(mix):
+    routes = []
+    weights = []
+    for entry in mix.split(","):
+        route, weight = entry.split("=")
+        routes.append(route.strip())
+        weights.append(float(weight))
+    return routes, weights
+
+
+def percentile(sorted_values, fraction):
+    #nearest-rank percentile of an already sorted list
+    if len(sorted_values) == 0:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+async def issue_request(client, route, names, rng):
+    #listings are given ids in the order they were generated
+    listing_id = rng.randrange(len(names))
+    name = names[listing_id]
+    if route == "search_results":
+        params = {
+            "item_name" : name.split(" ")[0][:rng.randint(1, 5)],
+            "item_category" : rng.randint(-1, len(CATEGORIES)),
+            "item_manufacturer" : rng.randint(-1, len(MANUFACTURERS))
+        }
+        return await client.get("/search_results", params=params)
+    elif route in ("search", "create_listing"):
+        return await client.get("/" + route)
+    elif route in ("add_stock", "remove_stock", "update_listing", "remove_listing"):
+        return await client.get("/" + route, params={"item_id" : listing_id})
+    elif route in ("stock_added", "stock_removed"):
+        return await client.post("/" + route, data={"item_id" : listing_id, "quantity" : 1})
+    
+    raise ValueError(f"Unknown route \"{route}\" in request mix")
+
+
+async def worker(client, routes, weights, names, rng, remaining, latencies, errors):
+    while remaining[0] > 0:
+        remaining[0] -= 1
+        route = rng.choices(routes, weights)[0]
+
+        start = time.perf_counter()
+        response = await issue_request(client, route, names, rng)
+        await response.read()
+        elapsed = time.perf_counter() - start
+
+        latencies[route].append(elapsed)
+        if response.status != 200:
+            errors[route] += 1
+
+
+async def run_load(args):
+    rng = random.Random(args.seed)
+    routes, weights = parse_mix(args.mix)
+
+    with tempfile.TemporaryDirectory() as directory:
+        config, names = build_catalog(directory, args.listings, rng)
+        ListingManager.initialise(config)
+
+        app = Website(args.templates_path, args.static_path)
+        async with TestClient(TestServer(app)) as client:
+            #warm the template cache and connection pool so they aren't measured
+            for route in routes:
+                await (await issue_request(client, route, names, rng)).read()
+
+            latencies = {route : [] for route in routes}
+            errors = {route : 0 for route in routes}
+            remaining = [args.requests]
+
+            start = time.perf_counter()
+            await asyncio.gather(*[
+                worker(client, routes, weights, names, random.Random(rng.random()), remaining, latencies, errors) 
+                for _ in range(args.concurrency)
+            ])
+            duration = time.perf_counter() - start
+
+    return summarise(latencies, errors, duration)
+
+
+def summarise(latencies, errors, duration):
+    report = {"duration" : duration, "routes" : {}}
+    all_latencies = []
+    for route, values in latencies.items():
+        values.sort()
+        all_latencies.extend(values)
+        report["routes"][route] = {
+            "requests" : len(values),
+            "errors" : errors[route],
+            "throughput" : len(values) / duration,
+            "p50_ms" : percentile(values, 0.50) * 1000,
+            "p95_ms" : percentile(values, 0.95) * 1000,
+            "p99_ms" : percentile(values, 0.99) * 1000,
+        }
+
+    all_latencies.sort()
+    report["routes"]["TOTAL"] = {
+        "requests" : len(all_latencies),
+        "errors" : sum(errors.values()),
+        "throughput" : len(all_latencies) / duration,
+        "p50_ms" : percentile(all_latencies, 0.50) * 1000,
+        "p95_ms" : percentile(all_latencies, 0.95) * 1000,
+        "p99_ms" : percentile(all_latencies, 0.99) * 1000,
+    }
+    return report
+
+
+def print_report(report):
+    print(f"{'route':<16}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for route, stats in report["routes"].items():
+        print(f"{route:<16}{stats['requests']:>10}{stats['errors']:>8}{stats['throughput']:>10.1f}" \
+            + f"{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}")
+    print(f"Completed in {report['duration']:.2f}s")
+
+
+if __name__ == "__main__":
+    config = configparser.ConfigParser()
+    config.read("Resources/config.cfg")
+
+    parser = argparse.ArgumentParser(
+                    prog='Inventory Manager load test',
+                    description='Drives the website against a temporary catalog and reports latency per route.',
+                    )
+    parser.add_argument("--templates-path", default=config.get("Operation", "JinjaTemplatesPath", fallback="Resources/Jinja templates/"))
+    parser.add_argument("--static-path", default=config.get("Operation", "StaticPath", fallback="Resources/static/"))
+    parser.add_argument("--listings", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", default=None, help="Also write the report to this file")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_load(args))
+    print_report(report)
+
+    if args.json is not None:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=4)
@@ -1,2 +1,3 @@
+from .registry import Registry
 from .listing import Listing
 from .listingmanager import ListingManager
\ No newline at end of file
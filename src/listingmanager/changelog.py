@@ -0,0 +1,125 @@
+import json
+import os
+
+from .durability import Durability
+
+
+class ChangeLog:
+    UNCHANGED = 0
+    APPENDED = 1
+    ROTATED = 2
+
+    def __init__(self, path, max_bytes = 1024 * 1024, durability = None):
+        self.path = path
+        self.rotated_path = path + ".1"
+        self.max_bytes = max_bytes
+        self.durability = Durability() if durability is None else durability
+
+        #position of the first change we have not yet applied, and the identity of the
+        #file it refers to. a different identity means the log has been rotated
+        self.offset = 0
+        self.inode = None
+
+    def stat(self):
+        try:
+            stat = os.stat(self.path)
+            return stat.st_ino, stat.st_size
+        except FileNotFoundError:
+            return None, 0
+
+    def status(self):
+        inode, size = self.stat()
+        if self.inode is None and self.offset == 0:
+            #the log didn't exist when we last looked, so everything in it is new
+            self.inode = inode
+        if inode != self.inode:
+            return ChangeLog.ROTATED
+        if size != self.offset:
+            return ChangeLog.APPENDED
+        return ChangeLog.UNCHANGED
+
+    def seek_end(self):
+        #skip every change logged so far. used just before loading the catalog from disk,
+        #so that only changes made after that point are replayed
+        self.inode, self.offset = self.stat()
+
+    def read_new(self):
+        #changes logged since we last looked, or None if some of them are no longer in the log
+        entries = []
+        if self.status() == ChangeLog.ROTATED:
+            #the log we were reading is kept when it is rotated, so finish it before starting the new one
+            rotated = self.read_from(self.rotated_path)
+            if rotated is None:
+                return None
+            entries = rotated
+            self.inode, self.offset = self.stat()[0], 0
+
+        current = self.read_from(self.path)
+        return None if current is None else entries + current
+
+    def read_from(self, path):
+        #changes in the file at path from our offset, or None if it isn't the file we were reading
+        try:
+            with open(path, "rb") as f:
+                if self.inode is not None and os.fstat(f.fileno()).st_ino != self.inode:
+                    return None
+                f.seek(self.offset)
+                data = f.read()
+        except FileNotFoundError:
+            return [] if self.inode is None else None
+
+        #a writer may be part way through a line, so only consume complete lines
+        end = data.rfind(b"\n") + 1
+        self.offset += end
+
+        entries = []
+        for line in data[:end].splitlines():
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                print(f"ChangeLog: Skipping malformed entry in \"{self.path}\"")
+        return entries
+
+    def append(self, entry):
+        caught_up = self.status() == ChangeLog.UNCHANGED
+
+        #the catalog on disk already includes every logged change, so once the log gets
+        #too big a new one is started
+        if self.stat()[1] > self.max_bytes:
+            self.rotate()
+
+        line = json.dumps(entry) + "\n"
+        with open(self.path, "a") as f:
+            f.write(line)
+            self.durability.written(f)
+            created = f.tell() == len(line)
+        self.durability.changed(self.path, created)
+
+        #we don't need to replay our own changes
+        if caught_up:
+            self.seek_end()
+
+    def rotate(self):
+        #start a new log, keeping the old one until the next rotation so that readers part way
+        #through it can finish it. only readers more than a rotation behind must reload the catalog
+        temp_path = self.create_empty()
+        if os.path.exists(self.path):
+            os.replace(self.path, self.rotated_path)
+            self.durability.changed(self.rotated_path)
+        os.replace(temp_path, self.path)
+        self.durability.changed(self.path)
+
+    def reset(self):
+        #start a new log without keeping the old one, so that every reader reloads the catalog.
+        #used when the catalog has changed in ways the log can't describe
+        os.replace(self.create_empty(), self.path)
+        self.durability.changed(self.path)
+        if os.path.exists(self.rotated_path):
+            os.remove(self.rotated_path)
+            self.durability.changed(self.rotated_path)
+
+    def create_empty(self):
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as f:
+            self.durability.written(f)
+        return temp_path
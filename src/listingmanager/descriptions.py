@@ -0,0 +1,44 @@
+import collections
+
+
+class DescriptionCache:
+    #descriptions of lazy listings, loaded with load(listing) when they are needed. only
+    #the size most recently used are kept
+    def __init__(self, load, size):
+        self.load = load
+        self.size = size
+        self.descriptions = collections.OrderedDict()
+
+    def get(self, listing):
+        if listing.id in self.descriptions:
+            self.descriptions.move_to_end(listing.id)
+            return self.descriptions[listing.id]
+
+        description = self.load(listing)
+        self.put(listing.id, description)
+        return description
+
+    def put(self, listing_id, description):
+        self.descriptions[listing_id] = description
+        self.descriptions.move_to_end(listing_id)
+        if len(self.descriptions) > self.size:
+            self.descriptions.popitem(last=False)
+
+    def release(self, listing, keep = True):
+        #take the description of a listing which has been saved out of it. if it had changed,
+        #it is kept here while recently used, unless keep is False
+        listing.loader = self
+        description = listing.unload()
+        if description is None:
+            return
+
+        if keep:
+            self.put(listing.id, description)
+        else:
+            self.descriptions.pop(listing.id, None)
+
+    def discard(self, listing_id):
+        self.descriptions.pop(listing_id, None)
+
+    def clear(self):
+        self.descriptions.clear()
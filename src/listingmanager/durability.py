@@ -0,0 +1,66 @@
+import os
+import time
+
+
+class Durability:
+    #how soon written files are synced to disk. with ALWAYS, before the write returns. with
+    #PERIODIC, at most interval seconds later, so a crash loses at most that much. with BUFFERED,
+    #whenever the operating system decides
+    ALWAYS = "always"
+    PERIODIC = "periodic"
+    BUFFERED = "buffered"
+    MODES = (ALWAYS, PERIODIC, BUFFERED)
+
+    def __init__(self, mode = BUFFERED, interval = 1.0):
+        if mode not in Durability.MODES:
+            raise ValueError(f"Durability must be one of {', '.join(Durability.MODES)}, not \"{mode}\"")
+        self.mode = mode
+        self.interval = interval
+
+        #files and directories changed since they were last synced
+        self.pending = set()
+        self.last_sync = time.monotonic()
+
+    def written(self, f):
+        #f has been written to, and is about to be closed
+        if self.mode == Durability.ALWAYS:
+            f.flush()
+            os.fsync(f.fileno())
+
+    def changed(self, path, created = True):
+        #path has been written to, replaced or removed. unless it already existed, the
+        #directory holding it has changed too
+        directory = os.path.dirname(os.path.abspath(path))
+        if self.mode == Durability.ALWAYS:
+            if created:
+                Durability.sync_path(directory)
+        elif self.mode == Durability.PERIODIC:
+            self.pending.add(path)
+            self.pending.add(directory)
+            if time.monotonic() - self.last_sync >= self.interval:
+                self.sync()
+
+    def sync(self):
+        #sync everything changed since the last time
+        pending = self.pending
+        self.pending = set()
+        self.last_sync = time.monotonic()
+        for path in pending:
+            Durability.sync_path(path)
+
+    @staticmethod
+    def sync_path(path):
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            #removed since it was changed
+            return
+        except OSError: #pragma: no cover
+            return #not every platform can open a directory
+
+        try:
+            os.fsync(fd)
+        except OSError: #pragma: no cover
+            pass
+        finally:
+            os.close(fd)
@@ -0,0 +1,166 @@
+import collections
+import json
+import os
+import struct
+import time
+
+from .durability import Durability
+
+class StockHistory:
+    #each change in stock is a fixed-size record of (time, listing id, change, new quantity).
+    #records are appended to numbered segment files. once a segment is full, it is sealed
+    #by writing an index beside it, which gives the time range it covers and the position
+    #of each listing's records. queries only read the segments, and records, they need
+    RECORD = struct.Struct("<dqqq")
+
+    #number of sealed segment indexes kept in memory after being read
+    CACHED_INDEXES = 16
+
+    def __init__(self, directory, segment_bytes = 1024 * 1024, durability = None):
+        self.directory = directory
+        self.segment_records = max(1, segment_bytes // StockHistory.RECORD.size)
+        self.durability = Durability() if durability is None else durability
+
+        #(first time, last time) of each sealed segment, by segment number. sealed segments
+        #never change, so their indexes can be kept once read
+        self.sealed = {}
+        self.indexes = collections.OrderedDict()
+
+        #the segment being appended to. its index is kept in memory, and is read from the
+        #segment itself, as other processes may be appending to it too
+        self.active = 0
+        self.active_records = 0
+        self.active_times = None
+        self.active_listings = {}
+
+    def segment_path(self, number, extension = "bin"):
+        return os.path.join(self.directory, f"{number:08d}.{extension}")
+
+    def refresh(self):
+        #find segments sealed since we last looked, and records appended to the active one
+        try:
+            files = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        
+        numbers = sorted(int(f[:-4]) for f in files if f.endswith(".bin") and f[:-4].isdigit())
+        for number in numbers:
+            if number in self.sealed or not os.path.exists(self.segment_path(number, "idx")):
+                continue
+            with open(self.segment_path(number, "idx"), "r") as f:
+                header = json.loads(f.readline())
+            self.sealed[number] = (header["first"], header["last"])
+
+        latest = numbers[-1] if len(numbers) > 0 else 0
+        while self.active in self.sealed or self.active < latest:
+            self.active += 1
+            self.active_records = 0
+            self.active_times = None
+            self.active_listings = {}
+
+        try:
+            with open(self.segment_path(self.active), "rb") as f:
+                f.seek(self.active_records * StockHistory.RECORD.size)
+                data = f.read()
+        except FileNotFoundError:
+            return
+
+        #a writer may be part way through a record, so only read complete ones
+        for offset in range(0, len(data) - StockHistory.RECORD.size + 1, StockHistory.RECORD.size):
+            timestamp, listing_id, _, _ = StockHistory.RECORD.unpack_from(data, offset)
+            self.index_record(timestamp, listing_id)
+
+    def index_record(self, timestamp, listing_id):
+        self.active_listings.setdefault(listing_id, []).append(self.active_records)
+        self.active_records += 1
+        if self.active_times is None:
+            self.active_times = (timestamp, timestamp)
+        else:
+            self.active_times = (min(self.active_times[0], timestamp), max(self.active_times[1], timestamp))
+
+    def record(self, listing_id, change, quantity, timestamp = None):
+        timestamp = time.time() if timestamp is None else timestamp
+        self.refresh()
+        if self.active_records >= self.segment_records:
+            self.seal()
+
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.segment_path(self.active), "ab") as f:
+            f.write(StockHistory.RECORD.pack(timestamp, listing_id, change, quantity))
+            self.durability.written(f)
+            created = f.tell() == StockHistory.RECORD.size
+        self.durability.changed(self.segment_path(self.active), created)
+        self.index_record(timestamp, listing_id)
+
+    def seal(self):
+        #the header is on its own line, so the time range can be read without the rest
+        header = {"first" : self.active_times[0], "last" : self.active_times[1], "records" : self.active_records}
+        temp_path = f"{self.segment_path(self.active, 'idx')}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as f:
+            f.write(json.dumps(header) + "\n" + json.dumps(self.active_listings))
+            self.durability.written(f)
+        os.replace(temp_path, self.segment_path(self.active, "idx"))
+        self.durability.changed(self.segment_path(self.active, "idx"))
+
+        self.sealed[self.active] = self.active_times
+        self.active += 1
+        self.active_records = 0
+        self.active_times = None
+        self.active_listings = {}
+
+    def query(self, listing_id = None, start = None, end = None) -> list:
+        #records from start (inclusive) to end (exclusive), oldest first. if given, only
+        #those for one listing
+        self.refresh()
+        segments = list(self.sealed.items())
+        if self.active_times is not None:
+            segments.append((self.active, self.active_times))
+
+        results = []
+        for number, (first, last) in sorted(segments):
+            if (start is not None and last < start) or (end is not None and first >= end):
+                continue
+
+            if listing_id is None:
+                positions = None
+            elif number == self.active:
+                positions = self.active_listings.get(listing_id, [])
+            else:
+                positions = self.sealed_index(number).get(str(listing_id), [])
+
+            if positions is not None and len(positions) == 0:
+                continue
+            results.extend(r for r in self.read_segment(number, positions)
+                           if (start is None or r["time"] >= start) and (end is None or r["time"] < end))
+
+        results.sort(key=lambda r: r["time"])
+        return results
+
+    def sealed_index(self, number):
+        if number in self.indexes:
+            self.indexes.move_to_end(number)
+            return self.indexes[number]
+
+        with open(self.segment_path(number, "idx"), "r") as f:
+            f.readline()
+            index = json.loads(f.readline())
+        self.indexes[number] = index
+        if len(self.indexes) > StockHistory.CACHED_INDEXES:
+            self.indexes.popitem(last=False)
+        return index
+
+    def read_segment(self, number, positions = None):
+        #read every record between the first and last positions wanted in one go
+        first = 0 if positions is None else positions[0]
+        with open(self.segment_path(number), "rb") as f:
+            f.seek(first * StockHistory.RECORD.size)
+            if positions is None:
+                data = f.read()
+            else:
+                data = f.read((positions[-1] - first + 1) * StockHistory.RECORD.size)
+
+        if positions is None:
+            positions = range(len(data) // StockHistory.RECORD.size)
+        for position in positions:
+            timestamp, listing_id, change, quantity = StockHistory.RECORD.unpack_from(data, (position - first) * StockHistory.RECORD.size)
+            yield {"time" : timestamp, "id" : listing_id, "change" : change, "quantity" : quantity}
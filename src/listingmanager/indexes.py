@@ -0,0 +1,403 @@
+import bisect
+import heapq
+import importlib.util
+import math
+
+#columnar filtering is optional, and falls back to visiting each listing. numpy takes a while
+#to import, so that is only done once a column index is made
+numpy = None
+numpy_available = importlib.util.find_spec("numpy") is not None
+
+from . import Listing
+
+
+#indexes are kept up to date by the listing manager as listings change. each one provides:
+#   clear()            - forget every listing
+#   add(listing)       - start tracking a listing
+#   discard(listing)   - stop tracking a listing. called before a listing is changed, and
+#                        add is called again afterwards, so indexes see the values they added
+
+
+class LookupIndex:
+    def __init__(self, key):
+        #key gives a value which is unique to each listing, such as its id or name
+        self.key = key
+        self.clear()
+
+    def clear(self):
+        self.listings = {}
+
+    def add(self, listing: Listing):
+        self.listings[self.key(listing)] = listing
+
+    def discard(self, listing: Listing):
+        if self.listings.get(self.key(listing)) is listing:
+            del self.listings[self.key(listing)]
+
+    def get(self, key):
+        return self.listings.get(key)
+
+
+class FacetIndex:
+    #number of name searches whose facets are remembered
+    CACHE_SIZE = 64
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        #number of listings with each (category, manufacturer) pair. there are far fewer
+        #pairs than listings, so facets for a query can be found without visiting listings
+        self.counts = {}
+
+        #facets of name searches, which have to be counted from their results. they are
+        #forgotten whenever a listing changes
+        self.searches = {}
+
+    def add(self, listing: Listing):
+        key = (listing.category, listing.manufacturer)
+        self.counts[key] = self.counts.get(key, 0) + 1
+        if len(self.searches) > 0:
+            self.searches.clear()
+
+    def discard(self, listing: Listing):
+        key = (listing.category, listing.manufacturer)
+        self.counts[key] -= 1
+        if self.counts[key] == 0:
+            del self.counts[key]
+        if len(self.searches) > 0:
+            self.searches.clear()
+
+    def searched(self, query):
+        #the facets remembered for a search, or None
+        return self.searches.get(query)
+
+    def remember(self, query, facets: dict):
+        if len(self.searches) >= FacetIndex.CACHE_SIZE:
+            del self.searches[next(iter(self.searches))]
+        self.searches[query] = facets
+
+    def facets(self, item_category: int, item_manufacturer: int) -> dict:
+        #number of listings in each category and manufacturer which match the filters
+        categories = {}
+        manufacturers = {}
+        for (category, manufacturer), count in self.counts.items():
+            if item_category != -1 and category != item_category:
+                continue
+            if item_manufacturer != -1 and manufacturer != item_manufacturer:
+                continue
+
+            categories[category] = categories.get(category, 0) + count
+            manufacturers[manufacturer] = manufacturers.get(manufacturer, 0) + count
+
+        return {"categories" : categories, "manufacturers" : manufacturers}
+
+    @staticmethod
+    def count(listings) -> dict:
+        #facets of an arbitrary set of listings, such as the results of a name search
+        categories = {}
+        manufacturers = {}
+        for l in listings:
+            categories[l.category] = categories.get(l.category, 0) + 1
+            manufacturers[l.manufacturer] = manufacturers.get(l.manufacturer, 0) + 1
+
+        return {"categories" : categories, "manufacturers" : manufacturers}
+
+
+class AggregateIndex:
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        #[number of listings, total quantity] in each category and manufacturer
+        self.categories = {}
+        self.manufacturers = {}
+        self.total_listings = 0
+        self.total_units = 0
+        self.out_of_stock = 0
+
+    def add(self, listing: Listing):
+        self.apply(listing, 1)
+
+    def discard(self, listing: Listing):
+        self.apply(listing, -1)
+
+    def apply(self, listing: Listing, sign: int):
+        for totals, key in ((self.categories, listing.category), (self.manufacturers, listing.manufacturer)):
+            entry = totals.setdefault(key, [0, 0])
+            entry[0] += sign
+            entry[1] += sign * listing.quantity
+            if entry[0] == 0:
+                del totals[key]
+
+        self.total_listings += sign
+        self.total_units += sign * listing.quantity
+        if listing.quantity == 0:
+            self.out_of_stock += sign
+
+    def summary(self) -> dict:
+        return {
+            "total_listings" : self.total_listings,
+            "total_units" : self.total_units,
+            "out_of_stock" : self.out_of_stock,
+            "categories" : {key : {"listings" : listings, "units" : units} for key, (listings, units) in self.categories.items()},
+            "manufacturers" : {key : {"listings" : listings, "units" : units} for key, (listings, units) in self.manufacturers.items()}
+        }
+
+
+class SortedIndex:
+    #keys added since the index was last read are kept aside. when there are at most this many
+    #they are inserted one at a time, otherwise they are all sorted in at once. inserting moves
+    #every key after it, so loading a whole catalog one insert at a time would take quadratic time
+    MOST_INSERTS = 32
+
+    def __init__(self, key):
+        #key gives the values a listing is sorted by. the name and object id are appended,
+        #so that ties are broken by name, keys are unique and the listing can be found again
+        self.key_function = key
+        self.clear()
+
+    def clear(self):
+        self.keys = []
+        self.added = []
+        self.listings = {}
+
+    def key(self, listing: Listing):
+        return self.key_function(listing) + (listing.name, id(listing))
+
+    def add(self, listing: Listing):
+        self.added.append(self.key(listing))
+        self.listings[id(listing)] = listing
+
+    def discard(self, listing: Listing):
+        self.settle()
+        index = bisect.bisect_left(self.keys, self.key(listing))
+        del self.keys[index]
+        del self.listings[id(listing)]
+
+    def settle(self):
+        #bring the keys added since the index was last read into order
+        if len(self.added) == 0:
+            return
+
+        if len(self.added) <= SortedIndex.MOST_INSERTS:
+            for key in self.added:
+                bisect.insort(self.keys, key)
+        else:
+            self.keys.extend(self.added)
+            self.keys.sort()
+        self.added = []
+
+    def iterate(self, descending: bool = False, prefix: tuple = ()):
+        #listings in sorted order. if given, only those whose key starts with prefix
+        self.settle()
+        start = 0
+        end = len(self.keys)
+        if len(prefix) > 0:
+            start = bisect.bisect_left(self.keys, prefix)
+            end = bisect.bisect_left(self.keys, prefix[:-1] + (prefix[-1] + 1,))
+        
+        positions = range(end - 1, start - 1, -1) if descending else range(start, end)
+        for position in positions:
+            yield self.listings[self.keys[position][-1]]
+
+
+class QuantityIndex(SortedIndex):
+    def __init__(self):
+        super().__init__(lambda l: (l.quantity,))
+
+    def clear(self):
+        super().clear()
+
+        #listings whose quantity is below their own reorder threshold
+        self.reorder = {}
+
+    def add(self, listing: Listing):
+        super().add(listing)
+        if listing.needs_reorder():
+            self.reorder[id(listing)] = listing
+
+    def discard(self, listing: Listing):
+        super().discard(listing)
+        self.reorder.pop(id(listing), None)
+
+    def below(self, threshold: int, offset: int = 0, limit = None) -> list:
+        #listings with a quantity less than threshold, lowest first. if given, only limit of them from offset
+        self.settle()
+        end = bisect.bisect_left(self.keys, (threshold,))
+        if limit is not None:
+            end = min(end, offset + limit)
+        return [self.listings[key[-1]] for key in self.keys[offset:end]]
+
+    def top(self, count: int) -> list:
+        #the count listings with the highest quantities, highest first
+        self.settle()
+        return [self.listings[key[-1]] for key in reversed(self.keys[max(0, len(self.keys) - count):])]
+
+    def needing_reorder(self, offset: int = 0, limit = None) -> list:
+        key = lambda l: (l.quantity, l.name)
+        if limit is None:
+            return sorted(self.reorder.values(), key=key)[offset:]
+        return heapq.nsmallest(offset + limit, self.reorder.values(), key=key)[offset:]
+
+
+class PrefixIndex(SortedIndex):
+    def __init__(self):
+        #names are compared lower case, so the listings starting with some text are next to
+        #each other in the index and can be found with a binary search
+        super().__init__(lambda l: (l.name.lower(),))
+
+    def complete(self, prefix: str, count: int) -> list:
+        #the first count names, alphabetically, which start with prefix
+        self.settle()
+        prefix = prefix.lower()
+        names = []
+        position = bisect.bisect_left(self.keys, (prefix,))
+        while position < len(self.keys) and len(names) < count and self.keys[position][0].startswith(prefix):
+            names.append(self.keys[position][1])
+            position += 1
+        return names
+
+
+class TrigramIndex:
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        #ids of the listings whose name contains each trigram, and the number of trigrams
+        #in each listing's name
+        self.postings = {}
+        self.sizes = {}
+        self.listings = {}
+
+    @staticmethod
+    def trigrams(text: str) -> set:
+        #padding the start means short words and the starts of words are still matched well
+        padded = "  " + text.lower().strip() + " "
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+    def add(self, listing: Listing):
+        trigrams = TrigramIndex.trigrams(listing.name)
+        for trigram in trigrams:
+            self.postings.setdefault(trigram, set()).add(id(listing))
+        self.sizes[id(listing)] = len(trigrams)
+        self.listings[id(listing)] = listing
+
+    def discard(self, listing: Listing):
+        for trigram in TrigramIndex.trigrams(listing.name):
+            self.postings[trigram].discard(id(listing))
+            if len(self.postings[trigram]) == 0:
+                del self.postings[trigram]
+        del self.sizes[id(listing)]
+        del self.listings[id(listing)]
+
+    def search(self, text: str, min_similarity: float, predicate = None, limit = None) -> list:
+        #listings with names similar to text, as (similarity, listing), most similar first.
+        #searches are for part of a name, so similarity is the fraction of the query's trigrams
+        #found in the name. ties go to the name with the fewest other trigrams
+        query = TrigramIndex.trigrams(text)
+        if len(query) == 0:
+            return []
+
+        #a listing similar enough to match must share at least this many trigrams with the query.
+        #trigrams no listing contains can't be shared, so the rest must provide them all
+        required = max(1, math.ceil(min_similarity * len(query)))
+        present = sorted((self.postings[trigram] for trigram in query if trigram in self.postings), key=len)
+        if len(present) < required:
+            return []
+
+        #results are ranked by the number of shared trigrams, so when only the best few are
+        #wanted, look for very close matches first and only widen the search if there aren't enough
+        most_misses = len(present) - required
+        misses = 0 if limit is not None else most_misses
+        while True:
+            results = self.search_misses(present, misses, len(query), predicate)
+            if misses == most_misses or len(results) >= limit:
+                break
+            misses = min(most_misses, misses * 2 + 1)
+
+        rank = lambda result: (-result[0], result[1], result[2].name)
+        if limit is None:
+            results = sorted(results, key=rank)
+        else:
+            results = heapq.nsmallest(limit, results, key=rank)
+        return [(similarity, listing) for similarity, _, listing in results]
+
+    def search_misses(self, present: list, most_misses: int, query_size: int, predicate) -> list:
+        #any listing missing at most most_misses of the present trigrams must contain at least
+        #one of the rarest (most_misses + 1). only listings in those postings can match
+        candidates = set().union(*present[:most_misses + 1])
+
+        #within[k] holds the candidates missing at most k of the trigrams seen so far. this is
+        #all done with set operations, rather than counting trigrams one listing at a time
+        within = [candidates] * (most_misses + 1)
+        for postings in present:
+            within = [within[0] & postings] + [(within[k] & postings) | within[k - 1] for k in range(1, most_misses + 1)]
+
+        results = []
+        for k in range(most_misses + 1):
+            for candidate in (within[k] - within[k - 1] if k > 0 else within[k]):
+                listing = self.listings[candidate]
+                if predicate is not None and not predicate(listing):
+                    continue
+                results.append(((len(present) - k) / query_size, self.sizes[candidate], listing))
+        return results
+
+
+class ColumnIndex:
+    #fields of every listing as numpy arrays, so that filters on them are evaluated over the
+    #whole catalog at once rather than one listing at a time. rows are in no particular order
+    COLUMNS = ("category", "manufacturer", "quantity")
+
+    def __init__(self):
+        global numpy
+        if not numpy_available:
+            raise ValueError("Columnar filtering requires numpy, which is not installed")
+        if numpy is None:
+            import numpy
+        self.clear()
+
+    def clear(self):
+        self.columns = {column : numpy.zeros(1024, dtype=numpy.int64) for column in ColumnIndex.COLUMNS}
+        self.rows = []
+        self.positions = {}
+
+    def add(self, listing: Listing):
+        row = len(self.rows)
+        for column, values in self.columns.items():
+            if row == len(values):
+                #leave room to grow, so arrays are only copied occasionally
+                values = self.columns[column] = numpy.concatenate((values, numpy.zeros_like(values)))
+            values[row] = getattr(listing, column)
+
+        self.rows.append(listing)
+        self.positions[id(listing)] = row
+
+    def discard(self, listing: Listing):
+        #move the last row into the gap, so no other rows need to be shifted
+        row = self.positions.pop(id(listing))
+        last = self.rows.pop()
+        if row == len(self.rows):
+            return
+
+        self.rows[row] = last
+        self.positions[id(last)] = row
+        for values in self.columns.values():
+            values[row] = values[len(self.rows)]
+
+    def select(self, item_category: int, item_manufacturer: int, quantity_below = None, most = None):
+        #listings matching every filter given, in no particular order. if more than most
+        #listings match, None is returned instead
+        size = len(self.rows)
+        mask = numpy.ones(size, dtype=bool)
+        if item_category != -1:
+            mask &= self.columns["category"][:size] == item_category
+        if item_manufacturer != -1:
+            mask &= self.columns["manufacturer"][:size] == item_manufacturer
+        if quantity_below is not None:
+            mask &= self.columns["quantity"][:size] < quantity_below
+
+        rows = numpy.flatnonzero(mask)
+        if most is not None and len(rows) > most:
+            return None
+        return [self.rows[row] for row in rows.tolist()]
@@ -2,10 +2,15 @@ import json
 
 from typing import Optional, TextIO, Tuple
 
+from .registry import Registry
+
 
 class Listing:
-    categories = {0: "Unsorted"}
-    manufacturers = {0 : "Manufacturer not listed"}
+    categories = Registry("Unsorted")
+    manufacturers = Registry("Manufacturer not listed")
+
+    #listings have no per-instance dict, which makes very large catalogs much smaller
+    __slots__ = ("name", "description", "category", "manufacturer", "quantity", "reorder_threshold", "id")
 
     def __init__(
             self, 
@@ -14,6 +19,8 @@ class Listing:
             category: int = 0,
             manufacturer: int = 0,
             quantity: int = 0,
+            reorder_threshold: Optional[int] = None,
+            id: Optional[int] = None,
             _force_construct: bool = False #this should never be used in production.
             ):                             #it exists only for use in testing.
         if not _force_construct:
@@ -25,12 +32,21 @@ class Listing:
                 raise ValueError("Category must be greater than zero")
             if not isinstance(quantity, int) or quantity < 0:
                 raise ValueError("Quantity must be greater than zero")
+            if reorder_threshold is not None and (not isinstance(reorder_threshold, int) or reorder_threshold < 0):
+                raise ValueError("Reorder threshold must be greater than zero")
+            if id is not None and (not isinstance(id, int) or id < 0):
+                raise ValueError("Id must be greater than zero")
 
         self.name = name.strip()
         self.description = description
         self.manufacturer = manufacturer
         self.quantity = quantity
         self.category = category
+        self.reorder_threshold = reorder_threshold
+
+        #given by the listing manager, and never changes. it is not part of what the listing
+        #is, so it is left out of comparisons
+        self.id = id
 
     def __str__(self) -> str:
         return f"Listing: {self.quantity}*\"{Listing.manufacturers[self.manufacturer]} :: {self.name}\" - {Listing.categories[self.category]}" \
@@ -45,15 +61,19 @@ class Listing:
             and (self.description == __value.description) \
             and (self.category == __value.category) \
             and (self.manufacturer == __value.manufacturer) \
-            and (self.quantity == __value.quantity)
+            and (self.quantity == __value.quantity) \
+            and (self.reorder_threshold == __value.reorder_threshold)
         
         return False
     
     def __ne__(self, __value: object) -> bool:
         return not self == __value
 
+    def needs_reorder(self) -> bool:
+        return self.reorder_threshold is not None and self.quantity < self.reorder_threshold
+
     def as_dict(self) -> dict:
-        return {
+        data = {
             "name" : self.name,
             "description" : self.description,
             "category" : self.category,
@@ -61,41 +81,75 @@ class Listing:
             "quantity" : self.quantity
         }
 
+        #optional fields are only stored when they are set
+        if self.reorder_threshold is not None:
+            data["reorder_threshold"] = self.reorder_threshold
+        if self.id is not None:
+            data["id"] = self.id
+        return data
+
     @classmethod
     def parse_categories(cls, file: str="listings/categories.txt") -> None:
-        try:
-            with open(file, "r") as f:
-                for line in f:
-                    category = line.strip()
-                    if category == "":
-                        continue
-
-                    if category in cls.categories.values():
-                        continue
-
-                    index = len(cls.categories)
-                    cls.categories[index] = category
-        except FileNotFoundError:
-            print(f"Listing: could not find \"{file}\"!")
+        cls.categories.parse(file)
     
     @classmethod
     def parse_manufacturers(cls, file: str="listings/manufacturers.txt") -> None:
-        try:
-            with open(file, "r") as f:
-                for line in f:
-                    manufacturer = line.strip()
-                    if manufacturer == "":
-                        continue
-
-                    if manufacturer in cls.manufacturers.values():
-                        continue
-
-                    index = len(cls.manufacturers)
-                    cls.manufacturers[index] = manufacturer
-        except FileNotFoundError:
-            print(f"Listing: could not find \"{file}\"!")
-
-    @staticmethod 
-    def from_file(file_obj: TextIO) -> Tuple[Optional['Listing'], bool]:
+        cls.manufacturers.parse(file)
+
+    @classmethod
+    def add_category(cls, name: str) -> int:
+        return cls.categories.add(name)
+    
+    @classmethod
+    def add_manufacturer(cls, name: str) -> int:
+        return cls.manufacturers.add(name)
+
+    @classmethod
+    def reload_vocabularies(cls) -> bool:
+        #pick up categories and manufacturers added to the files since they were parsed
+        categories_changed = cls.categories.reload_if_changed()
+        manufacturers_changed = cls.manufacturers.reload_if_changed()
+        return categories_changed or manufacturers_changed
+
+    @classmethod
+    def from_dict(cls, data: dict, trusted: bool = False) -> 'Listing':
+        if not trusted:
+            return cls(**data)
+        
+        #data we saved ourselves has already been validated, so skip straight to the fields
+        listing = cls.__new__(cls)
+        listing.name = data["name"]
+        listing.description = data["description"]
+        listing.category = data["category"]
+        listing.manufacturer = data["manufacturer"]
+        listing.quantity = data["quantity"]
+        listing.reorder_threshold = data.get("reorder_threshold")
+        listing.id = data.get("id")
+        return listing
+
+    @classmethod
+    def from_file(cls, file_obj: TextIO, trusted: bool = False) -> Tuple[Optional['Listing'], bool]:
         listing_data = json.load(file_obj)
-        return Listing(**listing_data), True
\ No newline at end of file
+        return cls.from_dict(listing_data, trusted), True
+
+
+class LazyListing(Listing):
+    #a listing whose description is left in its file once saved. it is read back through
+    #loader (a DescriptionCache) when needed, so only recently used descriptions stay in memory
+    __slots__ = ("loader",)
+
+    @property
+    def description(self) -> str:
+        description = Listing.description.__get__(self, LazyListing)
+        return self.loader.get(self) if description is None else description
+    
+    @description.setter
+    def description(self, description: str) -> None:
+        #kept in memory until the listing is next saved
+        Listing.description.__set__(self, description)
+
+    def unload(self) -> Optional[str]:
+        #forget the description, returning it if it was in memory
+        description = Listing.description.__get__(self, LazyListing)
+        Listing.description.__set__(self, None)
+        return description
\ No newline at end of file
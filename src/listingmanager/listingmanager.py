@@ -2,15 +2,130 @@ import json
 import pathlib
 import hashlib
 import os
+import contextlib
+import itertools
+
+try:
+    import fcntl
+except ImportError: #pragma: no cover
+    fcntl = None #file locking is only available on unix-like systems
 
 from . import Listing
+from .listing import LazyListing
+from .changelog import ChangeLog
+from .descriptions import DescriptionCache
+from .durability import Durability
+from .watcher import FileWatcher
+from .history import StockHistory
+from .indexes import LookupIndex, FacetIndex, AggregateIndex, SortedIndex, QuantityIndex, PrefixIndex, TrigramIndex, ColumnIndex
+
+
+def write_json(path, data, durability):
+    #write to a temporary file and swap it in, so readers never see a half-written file
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(data, f)
+        durability.written(f)
+    os.replace(temp_path, path)
+    durability.changed(path)
 
 
 class _ListingManagerInstance:
-    def __init__(self, listings_manifest = "listings/manifest.json"):
+    #filters are evaluated with the column index when they match at most this fraction of
+    #the catalog. the matches are sorted afterwards, which costs more than it saves for big results
+    COLUMNAR_FRACTION = 0.25
+
+    #number of descriptions kept in memory when they are loaded lazily
+    DESCRIPTION_CACHE = 4096
+
+    #most levels of subdirectories listing files can be spread over
+    MAX_SHARD_LEVELS = 3
+
+    #given instead of a value which may be None, to leave it as it is
+    UNCHANGED = object()
+
+    def __init__(self, listings_manifest = "listings/manifest.json", shared = False, read_only = False, background_load = False, columnar = False, trusted_load = False, lazy_descriptions = False, durability = Durability.BUFFERED, shard_levels = 0, watch = False):
         self.manifest_path = listings_manifest
+        self.directory = pathlib.Path(os.getcwd()).joinpath(pathlib.Path(self.manifest_path))
+        self.directory = pathlib.Path(os.path.join(*self.directory.parts[:-1]))
+
+        #very large catalogs can spread their listing files over levels of subdirectories, so
+        #that no one directory holds too many. the layout in use is recorded in the manifest, and
+        #catalogs are moved to the one wanted here when they are opened for writing
+        if not 0 <= shard_levels <= _ListingManagerInstance.MAX_SHARD_LEVELS:
+            raise ValueError(f"Listing files can be spread over at most {_ListingManagerInstance.MAX_SHARD_LEVELS} levels of subdirectories")
+        self.wanted_shard_levels = shard_levels
+
+        #how soon listing files, the manifest, the change log and stock history are synced to disk
+        self.durability = Durability(durability)
+
+        #listing files and change log entries are only ever written by us, so when trusted
+        #they are loaded without validating every listing again
+        self.trusted_load = trusted_load
+
+        #descriptions are most of each listing, but are only needed to show it. when lazy, they
+        #are left in the listing files and read back when needed, so large catalogs take less memory
+        self.listing_type = Listing
+        self.descriptions = None
+        if lazy_descriptions:
+            self.listing_type = LazyListing
+            self.descriptions = DescriptionCache(self.load_description, _ListingManagerInstance.DESCRIPTION_CACHE)
+
+        #when shared, several processes write to the same catalog, so writes are serialised
+        #with a lock file. every change is recorded in the change log so that the other
+        #processes (and any read-only followers) can apply it without reloading everything
+        self.shared = shared
+        self.read_only = read_only
+        self.lock_path = self.manifest_path + ".lock"
+        self.changelog = ChangeLog(self.manifest_path + ".changes", durability=self.durability)
 
-        #attempt to read the manifest
+        #every change in stock is kept, so the movements of a listing can be looked back on
+        self.history = StockHistory(self.manifest_path + ".history", durability=self.durability)
+        if self.shared and fcntl is None: #pragma: no cover
+            raise ValueError("Shared catalogs require file locking, which is not supported on this platform")
+
+        #indexes over the listings, kept up to date as listings change
+        self.by_id = LookupIndex(lambda l: l.id)
+        self.by_name = LookupIndex(lambda l: l.name)
+        self.facets = FacetIndex()
+        self.aggregates = AggregateIndex()
+        self.quantities = QuantityIndex()
+
+        #search results can be ordered by any of these. categories and manufacturers are
+        #ordered by id, which is the order they are listed in
+        self.sort_indexes = {
+            "name" : SortedIndex(lambda l: ()),
+            "quantity" : self.quantities,
+            "category" : SortedIndex(lambda l: (l.category,)),
+            "manufacturer" : SortedIndex(lambda l: (l.manufacturer,)),
+        }
+        self.prefixes = PrefixIndex()
+        self.trigrams = TrigramIndex()
+        self.indexes = [self.by_id, self.by_name, self.facets, self.aggregates, self.prefixes, self.trigrams] + list(self.sort_indexes.values())
+
+        #for very large catalogs, category, manufacturer and quantity filters can be evaluated
+        #in bulk with numpy. without it, every query visits the listings one at a time instead
+        self.columns = None
+        if columnar:
+            try:
+                self.columns = ColumnIndex()
+                self.indexes.append(self.columns)
+            except ValueError as e:
+                print(f"ListingManager: {e}. Filtering without it...")
+
+        #functions called with an event describing each change to a listing, whether it was
+        #made by this process or applied from the change log
+        self.listeners = []
+
+        #other tools sometimes edit the listing files or manifest directly. when watching, the
+        #files are polled by check_files, and only those which changed are loaded again
+        self.watcher = FileWatcher() if watch else None
+
+        #attempt to read the manifest. with background loading, the listings themselves are
+        #parsed a few at a time by load_pending (or on demand), so we can start serving sooner
+        self.reload(background_load)
+
+    def read_manifest(self):
         with open(self.manifest_path, "r") as f:
             manifest = json.load(f)
         
@@ -18,9 +133,183 @@ class _ListingManagerInstance:
         if not "listings" in manifest:
             print(f"ListingManager: \"{self.manifest_path}\" does not contain a \"listings\" entry!")
             raise ValueError(f"\"{self.manifest_path}\" does not contain a \"listings\" entry!")
+        
+        return manifest
+
+    def reload(self, background_load = False, reshard = True):
+        #without resharding, a catalog another tool has laid out differently is left as it is
+        if reshard and not self.read_only:
+            self.reshard()
 
-        #attempt to parse each listing
-        self.parse_listings(manifest)
+        #anything logged after this point will be replayed on the next refresh
+        self.changelog.seek_end()
+        if self.watcher is not None:
+            self.watcher.clear()
+            self.saw_file(self.manifest_path)
+        self.parse_listings(self.read_manifest())
+        if self.legacy_ids is not None and not self.read_only:
+            self.migrate()
+        elif not background_load:
+            self.load_pending()
+
+    def refresh(self, locked = False):
+        #apply changes made by other processes since we last looked
+        if self.changelog.status() == ChangeLog.UNCHANGED:
+            return False
+        
+        if locked or fcntl is None or not os.path.exists(self.lock_path):
+            self.apply_changes()
+            return True
+
+        #hold a shared lock so that we never read a catalog part way through a write
+        with open(self.lock_path, "r") as lock:
+            fcntl.flock(lock, fcntl.LOCK_SH)
+            try:
+                self.apply_changes()
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        return True
+
+    def apply_changes(self):
+        entries = self.changelog.read_new()
+        if entries is None:
+            #some of the changes since we last looked are gone, so listeners must start again too.
+            #the catalog may have been laid out differently by another process, which is followed
+            self.reload(reshard=False)
+            self.notify("reset")
+            return
+
+        for entry in entries:
+            self.apply_change(entry)
+
+    def apply_change(self, entry):
+        #changes may be replayed more than once, so applying them must be idempotent
+        index = self.get_listing_index_by_id(entry["id"])
+        if entry["op"] == "remove":
+            if index != -1:
+                self.notify("removed", self.pop_listing(index))
+            if self.descriptions is not None:
+                self.descriptions.discard(entry["id"])
+            if self.watcher is not None:
+                self.watcher.forget(self.file_name(entry["id"]))
+
+        elif entry["op"] == "upsert":
+            listing = self.listing_type.from_dict(entry["listing"], self.trusted_load)
+            if self.descriptions is not None:
+                self.descriptions.release(listing, keep=False)
+            self.next_id = max(self.next_id, listing.id + 1)
+            self.saw_file(self.file_name(listing.id))
+            if index != -1:
+                previous = self.listings[index]
+                self.replace_listing(index, listing)
+                self.notify("updated", listing, previous)
+            else:
+                self.append_listing(listing)
+                self.notify("created", listing)
+
+    #every change to the listings goes through these, so that the indexes stay up to date
+    def append_listing(self, listing):
+        if self.positions is not None:
+            self.positions[listing.id] = len(self.listings)
+        self.listings.append(listing)
+        self.index_listing(listing)
+
+    def pop_listing(self, index):
+        listing = self.listings.pop(index)
+        self.unindex_listing(listing)
+
+        #every listing after it has moved. their positions are worked out again when next needed
+        if index == len(self.listings) and self.positions is not None:
+            del self.positions[listing.id]
+        else:
+            self.positions = None
+        return listing
+
+    def replace_listing(self, index, listing):
+        self.unindex_listing(self.listings[index])
+        if self.positions is not None:
+            del self.positions[self.listings[index].id]
+            self.positions[listing.id] = index
+        self.listings[index] = listing
+        self.index_listing(listing)
+
+    def position(self, listing):
+        if self.positions is None:
+            self.positions = {l.id : i for i, l in enumerate(self.listings)}
+        return self.positions[listing.id]
+
+    def index_listing(self, listing):
+        for index in self.indexes:
+            index.add(listing)
+
+    def unindex_listing(self, listing):
+        for index in self.indexes:
+            index.discard(listing)
+
+    def log_change(self, op, listing, previous = None):
+        #op is the kind of change, as given to listeners. the log only needs to know
+        #whether the listing still exists
+        entry = {"op" : "remove" if op == "removed" else "upsert", "id" : listing.id}
+        if op != "removed":
+            entry["listing"] = listing.as_dict()
+        self.changelog.append(entry)
+        self.notify(op, listing, previous)
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def notify(self, op, listing = None, previous = None):
+        if len(self.listeners) == 0:
+            return
+        
+        event = {"op" : op}
+        if listing is not None:
+            event.update({
+                "id" : listing.id,
+                "name" : listing.name,
+                "category" : listing.category,
+                "manufacturer" : listing.manufacturer,
+                "quantity" : listing.quantity
+            })
+
+        #listeners filtering by category or manufacturer need to know when a listing moves out
+        if previous is not None and (previous.category, previous.manufacturer) != (listing.category, listing.manufacturer):
+            event["previous_category"] = previous.category
+            event["previous_manufacturer"] = previous.manufacturer
+        for listener in list(self.listeners):
+            listener(event)
+
+    @contextlib.contextmanager
+    def writing(self, listing_index = None):
+        #in shared mode, hold the catalog lock for the duration of a write and make sure
+        #we are modifying the latest version. as the catalog may change, the index of
+        #the listing being written is resolved again (-1 if it has since been removed)
+        if self.read_only:
+            raise PermissionError(f"\"{self.manifest_path}\" is open read-only")
+        
+        #writes may save the whole manifest, so every listing must be loaded first
+        if not self.is_loaded():
+            self.load_pending()
+
+        if not self.shared:
+            yield listing_index
+            return
+
+        listing_id = None if listing_index is None else self.listings[listing_index].id
+        with open(self.lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                self.refresh(locked=True)
+                if listing_id is not None:
+                    listing_index = self.get_listing_index_by_id(listing_id)
+
+                yield listing_index
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
 
     @staticmethod
     def hash(data):
@@ -28,141 +317,640 @@ class _ListingManagerInstance:
 
     def parse_listings(self, manifest):
         self.listings = []
-        self.directory = pathlib.Path(os.getcwd()).joinpath(pathlib.Path(self.manifest_path))
-        self.directory = pathlib.Path(os.path.join(*self.directory.parts[:-1]))
+        self.positions = {}
+        self.shard_levels = manifest.get("shard_levels", 0)
+
+        #files are loaded in manifest order by load_pending. unloaded files are also tracked
+        #by name so that a listing can be loaded early when it is looked up
+        self.pending = list(manifest["listings"])
+        self.pending_position = 0
+        self.unloaded = set(self.pending)
+
+        #catalogs saved before listings had ids name each file after a hash of the listing's
+        #name. until they are migrated, their listings are given ids in manifest order
+        self.next_id = manifest.get("next_id")
+        self.legacy_ids = None
+        if self.next_id is None:
+            self.legacy_ids = {file_name : i for i, file_name in enumerate(self.pending)}
+            self.next_id = len(self.pending)
+
+        for index in self.indexes:
+            index.clear()
+        if self.descriptions is not None:
+            self.descriptions.clear()
+
+    def migrate(self):
+        #save every listing to a file named after its id, so that renaming a listing no longer
+        #moves its file, and nothing needs to be hashed to find it. the old files are only removed
+        #once the manifest refers to the new ones, so if we are interrupted, nothing is lost
+        self.load_pending()
+        self.shard_levels = self.wanted_shard_levels
+        replaced = []
+        for file_name, listing_id in self.legacy_ids.items():
+            listing = self.by_id.get(listing_id)
+            if listing is None:
+                continue
+
+            #a lazy description must be read from the old file before the listing is saved to the new one
+            if self.descriptions is not None:
+                listing.description = listing.description
+            new_file_name = _ListingManagerInstance.shard(f"{listing_id}.json", self.shard_levels)
+            self.save_listing(listing, os.path.join(self.directory, new_file_name))
+            if file_name != new_file_name:
+                replaced.append(file_name)
+
+        self.legacy_ids = None
+        self.save_manifest()
+        for file_name in replaced:
+            path = os.path.join(self.directory, file_name)
+            if os.path.exists(path):
+                os.remove(path)
+                self.durability.changed(path)
+
+        #followers must reload the catalog to find its files again
+        self.changelog.reset()
+        if len(self.listings) > 0:
+            print(f"ListingManager: Gave ids to {len(self.listings)} listings in \"{self.manifest_path}\"")
+
+    @staticmethod
+    def shard(file_name, shard_levels):
+        #the path of a listing file, relative to the manifest. each level of subdirectory is
+        #named after the next two characters of a hash of the file's name, so files are spread evenly
+        if shard_levels == 0:
+            return file_name
+        digest = _ListingManagerInstance.hash(file_name)
+        return "/".join([digest[2 * i:2 * i + 2] for i in range(shard_levels)] + [file_name])
+
+    def reshard(self):
+        #move the listing files of a catalog laid out differently to the layout wanted. the
+        #manifest is only saved once every file has been moved, so if we are interrupted, the
+        #files already moved are found again next time
+        manifest = self.read_manifest()
+        shard_levels = manifest.get("shard_levels", 0)
+        if shard_levels == self.wanted_shard_levels or not "next_id" in manifest:
+            return
+        
+        moved = []
+        directories = set()
         for file_name in manifest["listings"]:
+            new_file_name = _ListingManagerInstance.shard(os.path.basename(file_name), self.wanted_shard_levels)
+            path = os.path.join(self.directory, file_name)
+            new_path = os.path.join(self.directory, new_file_name)
+            if os.path.exists(path) or not os.path.exists(new_path):
+                os.makedirs(os.path.dirname(new_path), exist_ok=True)
+                try:
+                    os.replace(path, new_path)
+                except FileNotFoundError:
+                    print(f"ListingManager: Error opening file \"{file_name}\" found in manifest. Skipping...")
+            moved.append(new_file_name)
+            directories.update((os.path.dirname(path), os.path.dirname(new_path)))
+
+        #the moves must reach the disk before the manifest refers to them
+        if self.durability.mode != Durability.BUFFERED:
+            for directory in directories:
+                Durability.sync_path(directory)
+
+        manifest["listings"] = moved
+        manifest["shard_levels"] = self.wanted_shard_levels
+        if self.wanted_shard_levels == 0:
+            del manifest["shard_levels"]
+        write_json(self.manifest_path, manifest, self.durability)
+
+        #remove the subdirectories left empty. the catalog's own directory still holds the manifest
+        for directory in directories:
             try:
-                with open(os.path.join(self.directory, file_name), "r") as f:
-                    listing, success = Listing.from_file(f)
-                    if success:
-                        self.listings.append(listing)
+                os.removedirs(directory)
+            except OSError:
+                pass
 
-            except FileNotFoundError:
-                print(f"ListingManager: Error opening file \"{file_name}\" found in manifest. Skipping...")
-            
-            except json.JSONDecodeError as jde:
-                print(f"ListingManager: Error parsing file \"{file_name}\" found in manifest. Skipping...")
+        #followers must reload the catalog to find its files again
+        self.changelog.reset()
+        print(f"ListingManager: Moved {len(moved)} listing files in \"{self.manifest_path}\" to {self.wanted_shard_levels} levels of subdirectories")
+
+    def load_pending(self, count = None):
+        #load up to count more listings (or all of them). returns True once all are loaded
+        end = len(self.pending) if count is None else min(len(self.pending), self.pending_position + count)
+        while self.pending_position < end:
+            file_name = self.pending[self.pending_position]
+            self.pending_position += 1
+            if file_name in self.unloaded:
+                self.load_listing_file(file_name)
+
+        #listings are added to the sorted indexes unsorted. they are put in order all at once
+        #when loading finishes, rather than by the first search
+        if self.is_loaded():
+            for index in [self.prefixes] + list(self.sort_indexes.values()):
+                index.settle()
+        return self.is_loaded()
+
+    def load_listing_file(self, file_name):
+        self.unloaded.discard(file_name)
+        self.saw_file(file_name)
+        try:
+            with open(os.path.join(self.directory, file_name), "r") as f:
+                listing, success = self.listing_type.from_file(f, self.trusted_load)
+                if not success:
+                    return
+                
+                if listing.id is None and self.legacy_ids is not None:
+                    listing.id = self.legacy_ids[file_name]
+
+                if listing.id is None or self.by_id.get(listing.id) is not None:
+                    print(f"ListingManager: File \"{file_name}\" found in manifest has a missing or duplicate id. Skipping...")
+                else:
+                    if self.descriptions is not None:
+                        self.descriptions.release(listing, keep=False)
+                    self.append_listing(listing)
+
+        except FileNotFoundError:
+            print(f"ListingManager: Error opening file \"{file_name}\" found in manifest. Skipping...")
         
+        except json.JSONDecodeError as jde:
+            print(f"ListingManager: Error parsing file \"{file_name}\" found in manifest. Skipping...")
+
+    def saw_file(self, file_name):
+        #files we have loaded or written ourselves have nothing new for the watcher to pick up
+        if self.watcher is not None:
+            self.watcher.seen(file_name, os.path.join(self.directory, file_name))
 
-    def save_listings(self):
-        #prepare the listings manifest and save each listing as we go
-        listing_filenames = self.save_manifest()["listings"]
+    def watched_files(self):
+        return [name for name in self.watcher.names() if name != self.manifest_path]
 
-        for l in self.listings:
-            #store the filename so it can be retrieved later
-            name_hash = _ListingManagerInstance.hash(l.name)
-            filename = f"{name_hash}.json"
+    def stat_files(self, names):
+        #stats of the listing files named which differ from when they were last seen. nothing is
+        #changed, so with very many files this can be run on another thread, and the results
+        #given to check_files
+        stats = {name : FileWatcher.stat(os.path.join(self.directory, name)) for name in names}
+        return {name : stat for name, stat in stats.items() if self.watcher.stats.get(name) != stat}
 
-            #open and save to each file
-            path = os.path.join(self.directory, filename)
+    def check_files(self, stats = None):
+        #apply changes made directly to the listing files or manifest since they were last seen.
+        #the manifest decides which listings there are, and their files what they contain.
+        #stats of the listing files are taken here unless given, from stat_files
+        if self.watcher is None or not self.is_loaded() or self.legacy_ids is not None:
+            return False
+        
+        #changes made by our other processes are already in the change log
+        self.refresh()
+        changed = False
+        if self.watcher.changed(self.manifest_path, self.manifest_path):
             try:
-                with open(path, "w") as f:
-                    json.dump(l.as_dict(), f)
-            except FileNotFoundError: #pragma: no cover
-                print("Could not open listing file {path}")
+                manifest = self.read_manifest()
+            except (ValueError, FileNotFoundError):
+                #it may be part way through being written. it will be checked again next time
+                self.watcher.forget(self.manifest_path)
+                return False
+            
+            if manifest.get("shard_levels", 0) != self.shard_levels or not "next_id" in manifest:
+                #every file has moved, so there is nothing to gain from checking them one at a time.
+                #the layout chosen by whatever moved them is followed rather than undone
+                self.reload(reshard=False)
+                self.notify("reset")
+                return True
+
+            listed = set(manifest["listings"])
+            for l in list(self.listings):
+                if not self.file_name(l.id) in listed:
+                    self.watcher.forget(self.file_name(l.id))
+                    self.notify("removed", self.pop_listing(self.position(l)))
+                    changed = True
+            for file_name in manifest["listings"]:
+                if not file_name in self.watcher.stats:
+                    changed = self.reload_listing_file(file_name) or changed
+            self.next_id = max(self.next_id, manifest["next_id"])
+
+        if stats is None:
+            stats = self.stat_files(self.watched_files())
+        #files we have written since the stats were taken look changed, but are found to match
+        #the listing when they are loaded again
+        for file_name in self.watcher.changes(stats):
+            changed = self.reload_listing_file(file_name) or changed
+        return changed
+
+    def reload_listing_file(self, file_name):
+        #bring a listing up to date with its file, which has been changed by something else
+        self.saw_file(file_name)
+        try:
+            listing_id = int(os.path.basename(file_name)[:-len(".json")])
+        except ValueError:
+            print(f"ListingManager: File \"{file_name}\" found in manifest is not named after a listing id. Skipping...")
+            return False
+        index = self.get_listing_index_by_id(listing_id)
+
+        try:
+            with open(os.path.join(self.directory, file_name), "r") as f:
+                listing, success = self.listing_type.from_file(f)
+        except FileNotFoundError:
+            if index == -1:
+                return False
+            self.notify("removed", self.pop_listing(index))
+            return True
+        except (json.JSONDecodeError, ValueError, TypeError):
+            #it will be loaded again when it next changes
+            print(f"ListingManager: Error parsing changed file \"{file_name}\". Skipping...")
+            return False
+
+        #the file's name says which listing it is
+        listing.id = listing_id
+        if self.descriptions is not None:
+            self.descriptions.release(listing, keep=False)
+        if index != -1 and listing == self.listings[index]:
+            return False
+        if self.get_listing_index(listing.name) not in (-1, index):
+            print(f"ListingManager: Changed file \"{file_name}\" has the same name as another listing. Skipping...")
+            return False
+
+        self.next_id = max(self.next_id, listing_id + 1)
+        if index != -1:
+            previous = self.listings[index]
+            self.replace_listing(index, listing)
+            self.notify("updated", listing, previous)
+        else:
+            self.append_listing(listing)
+            self.notify("created", listing)
+        return True
+
+    def is_loaded(self):
+        return self.pending_position >= len(self.pending)
+
+    def load_progress(self):
+        return len(self.pending) - len(self.unloaded), len(self.pending)
+        
+
+    def file_name(self, listing_id):
+        #where a listing's file is, relative to the manifest
+        if self.legacy_ids is not None:
+            #until they are migrated, listing ids are positions in the manifest
+            return self.pending[listing_id]
+        return _ListingManagerInstance.shard(f"{listing_id}.json", self.shard_levels)
+
+    def listing_path(self, listing_id):
+        return os.path.join(self.directory, self.file_name(listing_id))
+
+    def load_description(self, listing):
+        try:
+            with open(self.listing_path(listing.id), "r") as f:
+                return json.load(f)["description"]
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            print(f"ListingManager: Could not read the description of listing {listing.id}")
+            return ""
+
+    def save_listing(self, listing, path = None):
+        #each listing has its own file, so only the listing that changed needs saving
+        path = self.listing_path(listing.id) if path is None else path
+        if self.shard_levels > 0:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            write_json(path, listing.as_dict(), self.durability)
+        except FileNotFoundError: #pragma: no cover
+            print(f"Could not open listing file {path}")
+            return
+
+        self.saw_file(os.path.relpath(path, self.directory).replace(os.sep, "/"))
+
+        if self.descriptions is not None:
+            self.descriptions.release(listing)
 
     def save_manifest(self):
-        listings_manifest = {"listings" : []}
-        for l in self.listings:
-            name_hash = _ListingManagerInstance.hash(l.name)
-            filename = f"{name_hash}.json"
-            listings_manifest["listings"].append(filename)
+        listings_manifest = {"listings" : [_ListingManagerInstance.shard(f"{l.id}.json", self.shard_levels) for l in self.listings], "next_id" : self.next_id}
+        if self.shard_levels > 0:
+            listings_manifest["shard_levels"] = self.shard_levels
 
         try:
-            with open(self.manifest_path, "w") as f:
-                json.dump(listings_manifest, f)
+            write_json(self.manifest_path, listings_manifest, self.durability)
         except FileNotFoundError: #pragma: no cover
             print("Could not open listings manifest to save. This should not occur.")
+        self.saw_file(self.manifest_path)
 
         return listings_manifest
 
 
     def create_listing(self, name, desc, category, manufacturer):
-        #enforce uniqueness
-        if self.get_listing_index(name) != -1:
-            return False, f"Name must be unique. \"{name}\" was already listed."
+        with self.writing():
+            #enforce uniqueness
+            if self.get_listing_index(name) != -1:
+                return False, f"Name must be unique. \"{name}\" was already listed."
 
-        self.listings.append(Listing(name, desc, category, manufacturer, 0))
-        self.save_listings()
-        return True, None
+            listing = self.listing_type(name, desc, category, manufacturer, 0, id=self.next_id)
+            self.next_id += 1
+            self.append_listing(listing)
+            self.save_listing(listing)
+            self.save_manifest()
+            self.log_change("created", listing)
+            return True, None
 
-    def update_listing(self, index, new_name, new_description, new_category, new_manufacturer):
-        filename = _ListingManagerInstance.hash(self.listings[index].name) + ".json"
-        filepath = os.path.join(self.directory, filename)
-        if os.path.exists(filepath):
-            os.remove(filepath)
+    def update_listing(self, index, new_name, new_description, new_category, new_manufacturer, new_reorder_threshold = UNCHANGED):
+        if new_reorder_threshold is not _ListingManagerInstance.UNCHANGED and new_reorder_threshold is not None and new_reorder_threshold < 0:
+            return False
 
-        self.listings[index].name = new_name
-        self.listings[index].description = new_description
-        self.listings[index].category = new_category
-        self.listings[index].manufacturer = new_manufacturer
+        with self.writing(index) as index:
+            if index == -1:
+                return False
 
-        self.save_listings()
+            #enforce uniqueness. the listing may keep its own name
+            if self.get_listing_index(new_name) not in (-1, index):
+                return False
+
+            previous = Listing.from_dict(self.listings[index].as_dict(), trusted=True)
+            self.unindex_listing(self.listings[index])
+            self.listings[index].name = new_name
+            self.listings[index].description = new_description
+            self.listings[index].category = new_category
+            self.listings[index].manufacturer = new_manufacturer
+            if new_reorder_threshold is not _ListingManagerInstance.UNCHANGED:
+                self.listings[index].reorder_threshold = new_reorder_threshold
+            self.index_listing(self.listings[index])
+
+            self.save_listing(self.listings[index])
+            self.log_change("updated", self.listings[index], previous)
+            return True
 
     def remove_listing(self, listing_index):
-        l = self.listings.pop(listing_index)
-        self.save_manifest()
+        with self.writing(listing_index) as listing_index:
+            if listing_index == -1:
+                return None
+
+            l = self.pop_listing(listing_index)
+            self.save_manifest()
+
+            #the listing is given back, so it needs its description before the file goes
+            if self.descriptions is not None:
+                l.description = l.description
+                self.descriptions.discard(l.id)
 
-        filename = _ListingManagerInstance.hash(l.name) + ".json"
-        filepath = os.path.join(self.directory, filename)
-        if os.path.exists(filepath):
-            os.remove(filepath)
-        return l
+            filepath = self.listing_path(l.id)
+            if os.path.exists(filepath):
+                os.remove(filepath)
+                self.durability.changed(filepath)
+            if self.watcher is not None:
+                self.watcher.forget(self.file_name(l.id))
+
+            self.log_change("removed", l)
+            return l
 
     def get_listing_index(self, name):
-        for i, l in enumerate(self.listings):
-            if l.name == name:
-                return i
-            
-        return -1
+        listing = self.by_name.get(name)
+        if listing is None and not self.is_loaded():
+            #the listing may not have been loaded yet. files are named by id, so the whole
+            #catalog must be loaded to find it, unless it is still named after the listing
+            if self.legacy_ids is None:
+                self.load_pending()
+            elif _ListingManagerInstance.hash(name) + ".json" in self.unloaded:
+                self.load_listing_file(_ListingManagerInstance.hash(name) + ".json")
+            listing = self.by_name.get(name)
+
+        return -1 if listing is None else self.position(listing)
+
+    def get_listing_by_id(self, listing_id):
+        listing = self.by_id.get(listing_id)
+        if listing is None and not self.is_loaded():
+            #the listing may not have been loaded yet. its file can be found from its id, so load it now
+            file_name = _ListingManagerInstance.shard(f"{listing_id}.json", self.shard_levels)
+            if self.legacy_ids is not None:
+                file_name = self.pending[listing_id] if 0 <= listing_id < len(self.pending) else None
+            if file_name in self.unloaded:
+                self.load_listing_file(file_name)
+                listing = self.by_id.get(listing_id)
+
+        return listing
+
+    def get_listing_index_by_id(self, listing_id):
+        listing = self.get_listing_by_id(listing_id)
+        return -1 if listing is None else self.position(listing)
 
 
     def add_stock(self, listing_index, quantity):
-        if self.listings[listing_index].quantity + quantity < 0:
-            return False
-        else:
-            self.listings[listing_index].quantity += quantity
-            self.save_listings()
-            return True
+        with self.writing(listing_index) as listing_index:
+            if listing_index == -1:
+                return False
+
+            if self.listings[listing_index].quantity + quantity < 0:
+                return False
+            else:
+                self.unindex_listing(self.listings[listing_index])
+                self.listings[listing_index].quantity += quantity
+                self.index_listing(self.listings[listing_index])
+                self.save_listing(self.listings[listing_index])
+                self.log_change("updated", self.listings[listing_index])
+                if quantity != 0:
+                    self.history.record(self.listings[listing_index].id, quantity, self.listings[listing_index].quantity)
+                return True
 
     def remove_stock(self, listing_index, quantity):
         return self.add_stock(listing_index, -quantity)
 
+    def set_reorder_threshold(self, listing_index, threshold):
+        if threshold is not None and threshold < 0:
+            return False
+
+        with self.writing(listing_index) as listing_index:
+            if listing_index == -1:
+                return False
+
+            self.unindex_listing(self.listings[listing_index])
+            self.listings[listing_index].reorder_threshold = threshold
+            self.index_listing(self.listings[listing_index])
+            self.save_listing(self.listings[listing_index])
+            self.log_change("updated", self.listings[listing_index])
+            return True
+
+
+    def flush(self):
+        #sync writes which are still waiting for it
+        self.durability.sync()
 
     def get_listing(self, index):
         return self.listings[index]
 
-    def query_listings(self, name_segment: str, item_category: int, item_manufacturer: int):
-        listings = list(self.listings)
-
-        #remove all listings that do not match the manufacturer (if it is a search parameter)
-        if item_manufacturer != -1:
-            listings = [l for l in listings if l.manufacturer == item_manufacturer]
+    def iterate_query(self, name_segment: str, item_category: int, item_manufacturer: int, sort_key: str = "name", descending: bool = False):
+        #listings matching the query, in order. they are read from the index for the sort
+        #key, so they never need sorting, and the iteration can stop once a page is full
+        if not sort_key in self.sort_indexes:
+            raise ValueError(f"Cannot sort listings by \"{sort_key}\"")
+        
+        #when results are sorted by the field being searched for, only that part of the index is needed
+        prefix = ()
+        if sort_key == "category" and item_category != -1:
+            prefix = (item_category,)
+        elif sort_key == "manufacturer" and item_manufacturer != -1:
+            prefix = (item_manufacturer,)
 
-        #remove all listings that do not match the category (if it is a search parameter)
-        if item_category != -1:
-            listings = [l for l in listings if l.category == item_category]
+        #a narrow filter can pick out its few matches from the column index instead of
+        #visiting every listing. they then only need sorting
+        candidates = None
+        if self.columns is not None and prefix == () and (item_category != -1 or item_manufacturer != -1):
+            most = int(len(self.listings) * _ListingManagerInstance.COLUMNAR_FRACTION)
+            candidates = self.columns.select(item_category, item_manufacturer, most=most)
+            if candidates is not None:
+                candidates.sort(key=self.sort_indexes[sort_key].key, reverse=descending)
+        if candidates is None:
+            candidates = self.sort_indexes[sort_key].iterate(descending, prefix)
 
-        #any listing that does not contain the name segment should be discarded
         cleaned_segment = name_segment.strip()
-        if cleaned_segment != "":
-            listings = [l for l in listings if name_segment.lower() in l.name.lower()]
+        lowered_segment = name_segment.lower()
+        for l in candidates:
+            #remove all listings that do not match the manufacturer (if it is a search parameter)
+            if item_manufacturer != -1 and l.manufacturer != item_manufacturer:
+                continue
+
+            #remove all listings that do not match the category (if it is a search parameter)
+            if item_category != -1 and l.category != item_category:
+                continue
+
+            #any listing that does not contain the name segment should be discarded
+            if cleaned_segment != "" and not lowered_segment in l.name.lower():
+                continue
+
+            yield l
+
+    def query_listings(self, name_segment: str, item_category: int, item_manufacturer: int, sort_key: str = "name", descending: bool = False, offset: int = 0, limit = None):
+        results = self.iterate_query(name_segment, item_category, item_manufacturer, sort_key, descending)
+        return list(itertools.islice(results, offset, None if limit is None else offset + limit))
+
+    def batch_query_listings(self, queries, limit = None):
+        #results for many (name_segment, item_category, item_manufacturer) queries at once, keyed
+        #by query and ordered by name. queries are grouped by the part of the index they need,
+        #so each listing there is visited once, however many of the queries it is checked against
+        scans = {}
+        results = {}
+        for query in queries:
+            name_segment, item_category, item_manufacturer = query
+            if query in results:
+                continue
+            results[query] = []
+
+            if item_category != -1:
+                scan = ("category", item_category)
+            elif item_manufacturer != -1:
+                scan = ("manufacturer", item_manufacturer)
+            else:
+                scan = ("name",)
+            scans.setdefault(scan, []).append((name_segment.strip(), name_segment.lower(), item_category, item_manufacturer, results[query]))
+
+        for (sort_key, *prefix), pending in scans.items():
+            for l in self.sort_indexes[sort_key].iterate(False, tuple(prefix)):
+                #stop checking queries which already have enough results
+                if limit is not None:
+                    pending = [p for p in pending if len(p[-1]) < limit]
+                    if len(pending) == 0:
+                        break
+
+                lowered_name = l.name.lower()
+                for cleaned_segment, lowered_segment, item_category, item_manufacturer, matches in pending:
+                    if item_manufacturer != -1 and l.manufacturer != item_manufacturer:
+                        continue
+                    if item_category != -1 and l.category != item_category:
+                        continue
+                    if cleaned_segment != "" and not lowered_segment in lowered_name:
+                        continue
+
+                    matches.append(l)
+
+        return results
+
+    def fuzzy_query_listings(self, name_segment: str, item_category: int, item_manufacturer: int, limit = None, min_similarity: float = 0.5):
+        #listings with names similar to name_segment, most similar first, so that misspelt
+        #searches still find something. without a name, this is the same as query_listings
+        if name_segment.strip() == "":
+            return self.query_listings(name_segment, item_category, item_manufacturer, limit=limit)
+        
+        def matches(l):
+            return (item_category == -1 or l.category == item_category) \
+                and (item_manufacturer == -1 or l.manufacturer == item_manufacturer)
+        
+        return [l for _, l in self.trigrams.search(name_segment, min_similarity, matches, limit)]
 
+    def autocomplete(self, prefix: str, limit: int = 10):
+        #names of listings starting with prefix, to suggest while a search is being typed
+        if prefix.strip() == "":
+            return []
+        return self.prefixes.complete(prefix.lstrip(), limit)
+
+    def query_listings_with_facets(self, name_segment: str, item_category: int, item_manufacturer: int, sort_key: str = "name", descending: bool = False, offset: int = 0, limit = None, fuzzy: bool = False):
+        #the number of results in each category and manufacturer. without a name to match,
+        #these come straight from the facet index rather than from counting the results
+        if fuzzy and name_segment.strip() != "":
+            #fuzzy results are ordered by how well they match instead. only the closest matches up
+            #to the end of the page are found, as finding every slightly similar name is slow. facets
+            #would need every match, so none are given (None) rather than counts that fall short
+            results = self.fuzzy_query_listings(name_segment, item_category, item_manufacturer, None if limit is None else offset + limit)
+            facets = None
+            results = results[offset:None if limit is None else offset + limit]
+        elif name_segment.strip() == "":
+            results = self.query_listings(name_segment, item_category, item_manufacturer, sort_key, descending, offset, limit)
+            facets = self.facets.facets(item_category, item_manufacturer)
+        else:
+            #every match has to be visited to count them. they are counted in the same pass that
+            #collects the page, and remembered so that other pages of the search can stop early
+            query = (name_segment.lower(), item_category, item_manufacturer)
+            facets = self.facets.searched(query)
+            if facets is not None:
+                return self.query_listings(name_segment, item_category, item_manufacturer, sort_key, descending, offset, limit), facets
+
+            results = []
+            end = None if limit is None else offset + limit
+            def collect():
+                for position, l in enumerate(self.iterate_query(name_segment, item_category, item_manufacturer, sort_key, descending)):
+                    if offset <= position and (end is None or position < end):
+                        results.append(l)
+                    yield l
+            facets = FacetIndex.count(collect())
+            self.facets.remember(query, facets)
         
-        #sort the remaining listings by name, alphabetically. (Insertion sort)
-        for index in range(1, len(listings)):
-            current_index = index
-            swapped_listing = listings[index]
+        return results, facets
+    
+    
+    def get_listings_below(self, threshold, item_category = -1, item_manufacturer = -1, offset = 0, limit = None):
+        #lowest stock first. if given, only limit of them from offset, so pages of a large catalog stay small
+        end = None if limit is None else offset + limit
+        if item_category == -1 and item_manufacturer == -1:
+            return self.quantities.below(threshold, offset, limit)
+        
+        if self.columns is not None:
+            return sorted(self.columns.select(item_category, item_manufacturer, threshold), key=self.quantities.key)[offset:end]
+        below = itertools.takewhile(lambda l: l.quantity < threshold, self.quantities.iterate())
+        return list(itertools.islice((
+            l for l in below
+            if (item_category == -1 or l.category == item_category) and (item_manufacturer == -1 or l.manufacturer == item_manufacturer)
+        ), offset, end))
+    
+    def get_top_listings_by_quantity(self, count):
+        return self.quantities.top(count)
+    
+    def get_listings_to_reorder(self, offset = 0, limit = None):
+        return self.quantities.needing_reorder(offset, limit)
 
-            while current_index > 0 and (listings[current_index - 1].name > swapped_listing.name):
-                listings[current_index] = listings[current_index - 1]
-                current_index -= 1
+    def get_stock_history(self, listing_id = None, start = None, end = None):
+        #changes in stock between two times (in seconds since the epoch), oldest first
+        return self.history.query(listing_id, start, end)
 
-            listings[current_index] = swapped_listing 
-            
-        return listings
+    def get_inventory_summary(self):
+        #totals across the whole catalog. these are kept up to date as listings change,
+        #so this doesn't depend on the number of listings
+        return self.aggregates.summary()
     
     
+    def memory_subsystems(self):
+        #the parts of the catalog which hold on to memory, by name, for measuring how much.
+        #listings come first, so that the indexes are measured without the listings they refer to
+        subsystems = [("listings", self.listings), ("positions", self.positions)]
+        subsystems += [(f"sort_index.{key}", index) for key, index in self.sort_indexes.items()]
+        subsystems += [
+            ("by_id", self.by_id),
+            ("by_name", self.by_name),
+            ("facets", self.facets),
+            ("aggregates", self.aggregates),
+            ("prefixes", self.prefixes),
+            ("trigrams", self.trigrams),
+            ("columns", self.columns),
+            ("descriptions", None if self.descriptions is None else self.descriptions.descriptions),
+            ("pending", (self.pending, self.unloaded)),
+            ("history", (self.history.sealed, self.history.indexes, self.history.active_listings)),
+            ("watcher", None if self.watcher is None else self.watcher.stats),
+            ("vocabularies", (Listing.categories, Listing.manufacturers)),
+        ]
+        return subsystems
+
     #only exists for the purposes of testing
     def get_all_listings(self):
         return list(self.listings)
@@ -172,16 +960,73 @@ class ListingManager:
     __instance = None
 
     @staticmethod
-    def initialise(config, manifest_path = None):
+    def initialise(config, manifest_path = None, shared = False, read_only = False, background_load = False, columnar = False, trusted_load = False, lazy_descriptions = False, durability = Durability.BUFFERED, shard_levels = 0, watch = False, timed = None):
+        #timed, if given, is called with the name of each step to get a context manager timing it
+        timed = (lambda name: contextlib.nullcontext()) if timed is None else timed
         if manifest_path == None:
             manifest_path = config["Listings"]["ManifestPath"]
 
         category_file =  config["Listings"]["CategoriesPath"]
         manufacturer_file =  config["Listings"]["ManufacturersPath"]
 
-        Listing.parse_categories(category_file)
-        Listing.parse_manufacturers(manufacturer_file)
-        ListingManager.__instance = _ListingManagerInstance(manifest_path)
+        with timed("Parse categories"):
+            Listing.parse_categories(category_file)
+        with timed("Parse manufacturers"):
+            Listing.parse_manufacturers(manufacturer_file)
+        with timed("Parse listings"):
+            ListingManager.__instance = _ListingManagerInstance(manifest_path, shared, read_only, background_load, columnar, trusted_load, lazy_descriptions, durability, shard_levels, watch)
+
+    @staticmethod
+    def refresh():
+        return ListingManager.__instance.refresh()
+
+    @staticmethod
+    def add_listener(listener):
+        ListingManager.__instance.add_listener(listener)
+    
+    @staticmethod
+    def remove_listener(listener):
+        ListingManager.__instance.remove_listener(listener)
+    
+    @staticmethod
+    def flush():
+        ListingManager.__instance.flush()
+
+    @staticmethod
+    def is_watching():
+        return ListingManager.__instance.watcher is not None
+
+    @staticmethod
+    def watched_files():
+        return ListingManager.__instance.watched_files()
+
+    @staticmethod
+    def stat_files(names):
+        return ListingManager.__instance.stat_files(names)
+
+    @staticmethod
+    def check_files(stats = None):
+        return ListingManager.__instance.check_files(stats)
+
+    @staticmethod
+    def get_durability():
+        return ListingManager.__instance.durability.mode
+
+    @staticmethod
+    def is_read_only():
+        return ListingManager.__instance.read_only
+
+    @staticmethod
+    def load_pending(count = None):
+        return ListingManager.__instance.load_pending(count)
+
+    @staticmethod
+    def is_loaded():
+        return ListingManager.__instance.is_loaded()
+    
+    @staticmethod
+    def load_progress():
+        return ListingManager.__instance.load_progress()
 
 
     @staticmethod
@@ -189,8 +1034,8 @@ class ListingManager:
         return ListingManager.__instance.create_listing(name, desc, category, manufacturer)
     
     @staticmethod
-    def update_listing(index, new_name, new_description, new_category, new_manufacturer):
-        return ListingManager.__instance.update_listing(index, new_name, new_description, new_category, new_manufacturer)
+    def update_listing(index, new_name, new_description, new_category, new_manufacturer, new_reorder_threshold = _ListingManagerInstance.UNCHANGED):
+        return ListingManager.__instance.update_listing(index, new_name, new_description, new_category, new_manufacturer, new_reorder_threshold)
     
     @staticmethod
     def remove_listing(listing_index):
@@ -205,18 +1050,71 @@ class ListingManager:
         return ListingManager.__instance.remove_stock(listing, quantity)
 
 
+    @staticmethod
+    def set_reorder_threshold(listing, threshold):
+        return ListingManager.__instance.set_reorder_threshold(listing, threshold)
+
+
     @staticmethod
     def get_listing_index(name):
         return ListingManager.__instance.get_listing_index(name)
     
+    @staticmethod
+    def get_listing_by_id(listing_id):
+        return ListingManager.__instance.get_listing_by_id(listing_id)
+    
+    @staticmethod
+    def get_listing_index_by_id(listing_id):
+        return ListingManager.__instance.get_listing_index_by_id(listing_id)
+    
     @staticmethod
     def get_listing(index):
         return ListingManager.__instance.get_listing(index)
     
+    @staticmethod
+    def get_listings_below(threshold, item_category = -1, item_manufacturer = -1, offset = 0, limit = None):
+        return ListingManager.__instance.get_listings_below(threshold, item_category, item_manufacturer, offset, limit)
+    
+    @staticmethod
+    def get_top_listings_by_quantity(count):
+        return ListingManager.__instance.get_top_listings_by_quantity(count)
+    
+    @staticmethod
+    def get_listings_to_reorder(offset = 0, limit = None):
+        return ListingManager.__instance.get_listings_to_reorder(offset, limit)
+    
+    @staticmethod
+    def get_stock_history(listing_id = None, start = None, end = None):
+        return ListingManager.__instance.get_stock_history(listing_id, start, end)
+    
+    @staticmethod
+    def get_inventory_summary():
+        return ListingManager.__instance.get_inventory_summary()
+    
+    @staticmethod
+    def memory_subsystems():
+        return ListingManager.__instance.memory_subsystems()
+
     @staticmethod
     def get_all_listings():
         return ListingManager.__instance.get_all_listings()
     
     @staticmethod
-    def query_listings(name_segment, item_category, item_manufacturer):
-        return ListingManager.__instance.query_listings(name_segment, item_category, item_manufacturer)
+    def query_listings(name_segment, item_category, item_manufacturer, sort_key = "name", descending = False, offset = 0, limit = None):
+        return ListingManager.__instance.query_listings(name_segment, item_category, item_manufacturer, sort_key, descending, offset, limit)
+    
+    @staticmethod
+    def query_listings_with_facets(name_segment, item_category, item_manufacturer, sort_key = "name", descending = False, offset = 0, limit = None, fuzzy = False):
+        return ListingManager.__instance.query_listings_with_facets(name_segment, item_category, item_manufacturer, sort_key, descending, offset, limit, fuzzy)
+    
+    @staticmethod
+    def fuzzy_query_listings(name_segment, item_category, item_manufacturer, limit = None, min_similarity = 0.5):
+        return ListingManager.__instance.fuzzy_query_listings(name_segment, item_category, item_manufacturer, limit, min_similarity)
+    
+    @staticmethod
+    def batch_query_listings(queries, limit = None):
+        return ListingManager.__instance.batch_query_listings(queries, limit)
+    
+    @staticmethod
+    def autocomplete(prefix, limit = 10):
+        return ListingManager.__instance.autocomplete(prefix, limit)
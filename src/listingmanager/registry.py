@@ -0,0 +1,98 @@
+import os
+
+try:
+    import fcntl
+except ImportError: #pragma: no cover
+    fcntl = None #file locking is only available on unix-like systems
+
+
+class Registry(dict):
+    #a vocabulary of names, such as categories or manufacturers. it is used as a dict of
+    #id -> name, and also keeps the reverse mapping so names can be resolved without a scan.
+    #ids are given in the order names first appear, after the default name (which is 0)
+    def __init__(self, default_name: str):
+        super().__init__({0 : default_name})
+        self.default_name = default_name
+        self.ids = {default_name : 0}
+        self.file = None
+        self.file_stat = None
+
+    def get_id(self, name: str) -> int:
+        return self.ids.get(name.strip(), -1)
+
+    def register(self, name: str) -> int:
+        if name in self.ids:
+            return self.ids[name]
+
+        index = len(self)
+        self[index] = name
+        self.ids[name] = index
+        return index
+
+    def parse(self, file: str) -> None:
+        self.file = file
+        try:
+            with open(file, "r") as f:
+                for line in f:
+                    name = line.strip()
+                    if name == "":
+                        continue
+
+                    self.register(name)
+
+            self.file_stat = self.stat()
+        except FileNotFoundError:
+            print(f"Registry: could not find \"{file}\"!")
+
+    def stat(self):
+        try:
+            stat = os.stat(self.file)
+            return stat.st_mtime_ns, stat.st_size
+        except FileNotFoundError:
+            return None
+
+    def reload_if_changed(self) -> bool:
+        #ids are positions in the file, so re-reading it from scratch keeps existing ids
+        #as long as the file is only appended to
+        if self.file is None or self.stat() == self.file_stat:
+            return False
+
+        self.clear()
+        self.ids.clear()
+        self.register(self.default_name)
+        self.parse(self.file)
+        return True
+
+    def add(self, name: str) -> int:
+        #add a name at runtime and save it to the file so it persists across restarts
+        name = name.strip()
+        if name == "":
+            raise ValueError("Name cannot be blank or similar.")
+        if self.file is None:
+            return self.register(name)
+
+        with open(self.file, "a+") as f:
+            #other processes may be adding names too. hold the file while we make sure
+            #we've seen them all, so that the id we give out matches the file
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                self.reload_if_changed()
+                if name in self.ids:
+                    return self.ids[name]
+
+                f.seek(0, os.SEEK_END)
+                if f.tell() > 0:
+                    f.seek(f.tell() - 1)
+                    needs_newline = f.read(1) != "\n"
+                else:
+                    needs_newline = False
+                f.write(("\n" if needs_newline else "") + name + "\n")
+                f.flush()
+
+                index = self.register(name)
+                self.file_stat = self.stat()
+                return index
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
@@ -0,0 +1,69 @@
+import unittest
+import os
+import shutil
+
+from listingmanager.history import StockHistory
+
+
+class TestStockHistory(unittest.TestCase):
+    DUMMY_HISTORY_DIRECTORY = "test_temp_data/history"
+
+    #(time, listing id, change, quantity)
+    EXAMPLE_RECORDS = [
+        (100.0, 1, 5, 5),
+        (110.0, 2, 3, 3),
+        (120.0, 1, -2, 3),
+        (130.0, 3, 1, 1),
+        (140.0, 1, 4, 7),
+        (150.0, 2, -3, 0),
+        (160.0, 3, 1, 2),
+    ]
+
+    def setUp(self):
+        #small segments, so that records are spread over several of them
+        self.history = StockHistory(TestStockHistory.DUMMY_HISTORY_DIRECTORY, StockHistory.RECORD.size * 2)
+        for timestamp, listing_id, change, quantity in TestStockHistory.EXAMPLE_RECORDS:
+            self.history.record(listing_id, change, quantity, timestamp)
+
+    def tearDown(self):
+        shutil.rmtree(TestStockHistory.DUMMY_HISTORY_DIRECTORY, ignore_errors=True)
+
+    def expected(self, listing_id = None, start = None, end = None):
+        return [
+            {"time" : timestamp, "id" : i, "change" : change, "quantity" : quantity}
+            for timestamp, i, change, quantity in TestStockHistory.EXAMPLE_RECORDS
+            if (listing_id is None or i == listing_id) and (start is None or timestamp >= start) and (end is None or timestamp < end)
+        ]
+
+
+    def test_0_segments(self):
+        files = sorted(os.listdir(TestStockHistory.DUMMY_HISTORY_DIRECTORY))
+        self.assertEqual(files, [
+            "00000000.bin", "00000000.idx", "00000001.bin", "00000001.idx",
+            "00000002.bin", "00000002.idx", "00000003.bin"
+        ])
+        self.assertEqual(self.history.sealed, {0 : (100.0, 110.0), 1 : (120.0, 130.0), 2 : (140.0, 150.0)})
+
+    def test_1_query(self):
+        self.assertEqual(self.history.query(), self.expected())
+        for listing_id in (1, 2, 3, 4):
+            self.assertEqual(self.history.query(listing_id), self.expected(listing_id))
+            for start, end in ((None, 125.0), (120.0, None), (115.0, 145.0), (200.0, None), (120.0, 120.0)):
+                self.assertEqual(self.history.query(listing_id, start, end), self.expected(listing_id, start, end))
+
+    def test_2_other_processes(self):
+        #another process sees what has been recorded, and can carry on where it left off
+        other = StockHistory(TestStockHistory.DUMMY_HISTORY_DIRECTORY, StockHistory.RECORD.size * 2)
+        self.assertEqual(other.query(1), self.expected(1))
+        other.record(1, 1, 8, 170.0)
+        self.history.record(2, 1, 1, 180.0)
+
+        self.assertEqual(self.history.query(1, 165.0), [{"time" : 170.0, "id" : 1, "change" : 1, "quantity" : 8}])
+        self.assertEqual(other.query(2, 165.0), [{"time" : 180.0, "id" : 2, "change" : 1, "quantity" : 1}])
+        self.assertEqual(self.history.query(), other.query())
+        self.assertEqual(len(self.history.query()), len(TestStockHistory.EXAMPLE_RECORDS) + 2)
+
+    def test_3_empty(self):
+        missing = StockHistory(TestStockHistory.DUMMY_HISTORY_DIRECTORY + "/doesn't exist")
+        self.assertEqual(missing.query(), [])
+        self.assertFalse(os.path.exists(TestStockHistory.DUMMY_HISTORY_DIRECTORY + "/doesn't exist"))
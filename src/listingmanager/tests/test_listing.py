@@ -2,7 +2,7 @@ import unittest
 import os
 import json
 
-from listingmanager import Listing
+from listingmanager import Listing, Registry
 
 
 class TestListing(unittest.TestCase):
@@ -28,7 +28,11 @@ class TestListing(unittest.TestCase):
         (False, "Listing 4", "", 3, 0, 200),
         (True, "", "Description 5", 3, 0, 200),
         (True, "Listing 6", "Description 6", -1, 0, 0),
-        (True, "Listing 7", "Description 7", 0, -1, 0)
+        (True, "Listing 7", "Description 7", 0, -1, 0),
+        (False, "Listing 8", "Description 8", 0, 0, 0, 10),
+        (True, "Listing 9", "Description 9", 0, 0, 0, -1),
+        (False, "Listing 10", "Description 10", 0, 0, 0, None, 4),
+        (True, "Listing 11", "Description 11", 0, 0, 0, None, -4)
     ]
 
     def tearDown(self):
@@ -75,7 +79,7 @@ class TestListing(unittest.TestCase):
         expected_result = default_categories | {i + 1 : l for i, l in enumerate(TestListing.EXPECTED_CATEGORIES)}
         self.assertEqual(expected_result, Listing.categories)
         self.remove_categories()
-        Listing.categories = default_categories
+        Listing.categories = Registry("Unsorted")
 
     def test_1_parse_manufacturers(self):
         self.remove_manufacturers()
@@ -90,7 +94,7 @@ class TestListing(unittest.TestCase):
         expected_result = default_manufacturers | {i + 1 : l for i, l in enumerate(TestListing.EXPECTED_MANUFACTURERS)}
         self.assertEqual(expected_result, Listing.manufacturers)
         self.remove_manufacturers()
-        Listing.manufacturers = default_manufacturers
+        Listing.manufacturers = Registry("Manufacturer not listed")
 
     def test_2_from_file(self):
         self.prepare_manufacturers()
@@ -156,6 +160,13 @@ class TestListing(unittest.TestCase):
             }
             self.assertEqual(expected_dict, listing.as_dict())
 
+        #optional fields are only included when set
+        listing = Listing("Listing 1", "Description 1", 0, 0, 3, 5)
+        self.assertEqual(listing.as_dict()["reorder_threshold"], 5)
+        self.assertTrue(listing.needs_reorder())
+        listing = Listing("Listing 1", "Description 1", 0, 0, 3, id=7)
+        self.assertEqual(listing.as_dict()["id"], 7)
+
     def test_5_constructor(self):
         for fails, *data in TestListing.CONSTRUCTOR_EXAMPLE_DATA:
             if fails:
@@ -172,6 +183,8 @@ class TestListing(unittest.TestCase):
             self.assertEqual(listing.category, data[2])
             self.assertEqual(listing.manufacturer, data[3])
             self.assertEqual(listing.quantity, data[4])
+            self.assertEqual(listing.reorder_threshold, data[5] if len(data) > 5 else None)
+            self.assertEqual(listing.id, data[6] if len(data) > 6 else None)
         
     def test_6_eq(self):
         listings = []
@@ -182,4 +195,26 @@ class TestListing(unittest.TestCase):
         for i in range(1, len(listings)):
             self.assertNotEqual(listings[i], 0)
             self.assertNotEqual(listings[i], listings[i - 1])
-            self.assertEqual(listings[i], listings[i])
\ No newline at end of file
+            self.assertEqual(listings[i], listings[i])
+
+        #ids are not part of what a listing is
+        self.assertEqual(Listing(*TestListing.EXAMPLE_DATA[0], id=1), Listing(*TestListing.EXAMPLE_DATA[0], id=2))
+
+    def test_7_from_dict(self):
+        for fails, *data in TestListing.CONSTRUCTOR_EXAMPLE_DATA:
+            listing = Listing(*data, _force_construct = True)
+
+            #trusted data skips validation entirely
+            trusted = Listing.from_dict(listing.as_dict(), trusted = True)
+            self.assertEqual(trusted, listing)
+            self.assertEqual(trusted.id, listing.id)
+            
+            if fails:
+                with self.assertRaises(ValueError):
+                    Listing.from_dict(listing.as_dict())
+            else:
+                self.assertEqual(Listing.from_dict(listing.as_dict()), listing)
+
+        #listings are slotted, so they can't be given other attributes
+        with self.assertRaises(AttributeError):
+            Listing(*TestListing.EXAMPLE_DATA[0]).colour = "red"
\ No newline at end of file
@@ -2,9 +2,12 @@ import unittest
 import json
 import os
 import configparser
+import shutil
+import time
 
 from listingmanager import ListingManager, Listing
 from listingmanager.listingmanager import _ListingManagerInstance
+from listingmanager.indexes import numpy_available, FacetIndex
 
 
 class TestListingManager(unittest.TestCase):
@@ -49,11 +52,18 @@ class TestListingManager(unittest.TestCase):
         self.remove_manifest()
         self.remove_listing_files()
         self.remove_config_files()
+        self.remove_shared_files()
 
     def remove_manifest(self):
         if os.path.exists(TestListingManager.DUMMY_MANIFEST_FILE):
             os.remove(TestListingManager.DUMMY_MANIFEST_FILE)
 
+    def remove_shared_files(self):
+        for path in (TestListingManager.DUMMY_MANIFEST_FILE + ".lock", TestListingManager.DUMMY_MANIFEST_FILE + ".changes", TestListingManager.DUMMY_MANIFEST_FILE + ".changes.1"):
+            if os.path.exists(path):
+                os.remove(path)
+        shutil.rmtree(TestListingManager.DUMMY_MANIFEST_FILE + ".history", ignore_errors=True)
+
     def remove_listing_files(self):
         if os.path.exists(TestListingManager.DUMMY_LISTING_FILE):
             os.remove(TestListingManager.DUMMY_LISTING_FILE)
@@ -158,7 +168,7 @@ class TestListingManager(unittest.TestCase):
             listing = ListingManager.remove_listing(index)
             self.assertEqual(Listing(data[0], data[1], data[2], data[3], 0), listing)
 
-            filename = _ListingManagerInstance.hash(listing.name) + ".json"
+            filename = f"{listing.id}.json"
             filepath = os.path.join(ListingManager._ListingManager__instance.directory, filename)
             self.assertFalse(os.path.exists(filepath))
         
@@ -247,5 +257,747 @@ class TestListingManager(unittest.TestCase):
             self.assertEqual(expected_result, ListingManager.query_listings(*args))
 
 
+    def test_10_shared_catalog(self):
+        first = _ListingManagerInstance(TestListingManager.DUMMY_MANIFEST_FILE, shared=True)
+        second = _ListingManagerInstance(TestListingManager.DUMMY_MANIFEST_FILE, shared=True)
+
+        #changes made by one process are only seen by the other after a refresh
+        for data in TestListingManager.EXAMPLE_DATA:
+            self.assertTrue(first.create_listing(data[0], data[1], data[2], data[3])[0])
+        self.assertEqual(second.get_all_listings(), [])
+        self.assertTrue(second.refresh())
+        self.assertFalse(second.refresh())
+        self.assertEqual(first.get_all_listings(), second.get_all_listings())
+
+        #a stale process must not be able to break uniqueness
+        first.create_listing("Shared listing", "", 0, 0)
+        self.assertFalse(second.create_listing("Shared listing", "", 0, 0)[0])
+
+        #writes made with a stale index are applied to the same listing in the latest catalog
+        stale_index = second.get_listing_index("Listing 3")
+        first.remove_listing(first.get_listing_index("Listing 1"))
+        self.assertTrue(second.add_stock(stale_index, 5))
+        first.refresh()
+        self.assertEqual(first.get_listing(first.get_listing_index("Listing 3")).quantity, 5)
+
+        #writes to listings removed by another process fail
+        stale_index = second.get_listing_index("Listing 2")
+        first.remove_listing(first.get_listing_index("Listing 2"))
+        self.assertFalse(second.add_stock(stale_index, 5))
+
+        for listing in first.get_all_listings():
+            first.remove_listing(first.get_listing_index(listing.name))
+        ListingManager.refresh()
+
+    def test_11_read_only_follower(self):
+        follower = _ListingManagerInstance(TestListingManager.DUMMY_MANIFEST_FILE, read_only=True)
+        self.assertFalse(follower.refresh())
+
+        #followers apply the primary's changes without reloading the catalog
+        for data in TestListingManager.EXAMPLE_DATA:
+            ListingManager.create_listing(data[0], data[1], data[2], data[3])
+        ListingManager.add_stock(ListingManager.get_listing_index("Listing 2"), 7)
+        ListingManager.update_listing(ListingManager.get_listing_index("Listing 3"), "Listing 3 new", "Description 3", 3, 0)
+        ListingManager.remove_listing(ListingManager.get_listing_index("Listing 1"))
+
+        self.assertTrue(follower.refresh())
+        self.assertEqual(ListingManager.get_all_listings(), follower.get_all_listings())
+        self.assertEqual(follower.get_listing(follower.get_listing_index("Listing 2")).quantity, 7)
+
+        #replaying changes that are already applied has no effect
+        follower.changelog.offset = 0
+        self.assertTrue(follower.refresh())
+        self.assertEqual(ListingManager.get_all_listings(), follower.get_all_listings())
+
+        #once the log is rotated, followers finish the old one and carry on with the new one
+        events = []
+        follower.add_listener(events.append)
+        ListingManager.add_stock(ListingManager.get_listing_index("Listing 2"), 1)
+        ListingManager._ListingManager__instance.changelog.rotate()
+        ListingManager.add_stock(ListingManager.get_listing_index("Listing 2"), 1)
+        self.assertTrue(follower.refresh())
+        self.assertEqual(ListingManager.get_all_listings(), follower.get_all_listings())
+        self.assertEqual([event["quantity"] for event in events], [8, 9])
+
+        #unless they were more than a rotation behind, in which case they reload the catalog from disk
+        ListingManager._ListingManager__instance.changelog.rotate()
+        ListingManager.add_stock(ListingManager.get_listing_index("Listing 2"), 1)
+        ListingManager._ListingManager__instance.changelog.rotate()
+        ListingManager.add_stock(ListingManager.get_listing_index("Listing 2"), 1)
+        self.assertTrue(follower.refresh())
+        self.assertEqual(ListingManager.get_all_listings(), follower.get_all_listings())
+        self.assertEqual(events[-1], {"op" : "reset"})
+        follower.remove_listener(events.append)
+
+        #followers can never write to the catalog
+        with self.assertRaises(PermissionError):
+            follower.create_listing("Listing 5", "", 0, 0)
+        with self.assertRaises(PermissionError):
+            follower.add_stock(0, 1)
+
+    def test_12_background_load(self):
+        for data in TestListingManager.EXAMPLE_DATA:
+            ListingManager.create_listing(data[0], data[1], data[2], data[3])
+        expected_listings = ListingManager.get_all_listings()
+
+        lazy = _ListingManagerInstance(TestListingManager.DUMMY_MANIFEST_FILE, background_load=True)
+        self.assertEqual(lazy.get_all_listings(), [])
+        self.assertEqual(lazy.load_progress(), (0, len(expected_listings)))
+        self.assertFalse(lazy.is_loaded())
+
+        #listings can be looked up by id before they are reached
+        index = lazy.get_listing_index_by_id(expected_listings[2].id)
+        self.assertEqual(lazy.get_listing(index), expected_listings[2])
+        self.assertEqual(lazy.get_listing_index_by_id(100), -1)
+        self.assertEqual(lazy.load_progress(), (1, len(expected_listings)))
+
+        self.assertFalse(lazy.load_pending(2))
+        self.assertEqual(lazy.load_progress(), (3, len(expected_listings)))
+        self.assertTrue(lazy.load_pending(2))
+        self.assertTrue(lazy.is_loaded())
+        self.assertCountEqual(lazy.get_all_listings(), expected_listings)
+
+        #writing loads the rest of the catalog first, so nothing is dropped from the manifest
+        lazy = _ListingManagerInstance(TestListingManager.DUMMY_MANIFEST_FILE, background_load=True)
+        self.assertTrue(lazy.add_stock(lazy.get_listing_index("Listing 1"), 1))
+        self.assertTrue(lazy.is_loaded())
+        self.assertEqual(len(lazy.read_manifest()["listings"]), len(expected_listings))
+
+    def test_13_query_listings_with_facets(self):
+        for data in TestListingManager.EXAMPLE_DATA:
+            ListingManager.create_listing(data[0], data[1], data[2], data[3])
+
+        arguments = [
+            ("", -1, -1),
+            ("Listing", -1, -1),
+            ("", 0, -1),
+            ("  ", 0, 1),
+            ("Nothing", -1, -1)
+        ]
+        for args in arguments:
+            results, facets = ListingManager.query_listings_with_facets(*args)
+            self.assertEqual(results, ListingManager.query_listings(*args))
+
+            expected_categories = {}
+            expected_manufacturers = {}
+            for l in results:
+                expected_categories[l.category] = expected_categories.get(l.category, 0) + 1
+                expected_manufacturers[l.manufacturer] = expected_manufacturers.get(l.manufacturer, 0) + 1
+            self.assertEqual(facets, {"categories" : expected_categories, "manufacturers" : expected_manufacturers})
+
+        #facets follow changes to listings
+        ListingManager.update_listing(ListingManager.get_listing_index("Listing 1"), "Listing 1", "", 3, 3)
+        ListingManager.remove_listing(ListingManager.get_listing_index("Listing 2"))
+        facets = ListingManager.query_listings_with_facets("", -1, -1)[1]
+        self.assertEqual(facets, {"categories" : {0 : 1, 3 : 2}, "manufacturers" : {0 : 1, 3 : 2}})
+
+        #facets of a name search count every match, whichever page is asked for
+        for offset in (0, 1, 0):
+            results, facets = ListingManager.query_listings_with_facets("listing", -1, -1, offset=offset, limit=1)
+            self.assertEqual(results, ListingManager.query_listings("listing", -1, -1, offset=offset, limit=1))
+            self.assertEqual(facets, {"categories" : {3 : 2}, "manufacturers" : {3 : 1, 0 : 1}})
+        ListingManager.update_listing(ListingManager.get_listing_index("Listing 3"), "Listing 3", "", 0, 0)
+        facets = ListingManager.query_listings_with_facets("listing", -1, -1, offset=1, limit=1)[1]
+        self.assertEqual(facets, {"categories" : {3 : 1, 0 : 1}, "manufacturers" : {3 : 1, 0 : 1}})
+
+    def check_inventory_summary(self):
+        #the running totals should always match totals calculated from scratch
+        listings = ListingManager.get_all_listings()
+        categories = {}
+        manufacturers = {}
+        for l in listings:
+            for totals, key in ((categories, l.category), (manufacturers, l.manufacturer)):
+                totals.setdefault(key, {"listings" : 0, "units" : 0})
+                totals[key]["listings"] += 1
+                totals[key]["units"] += l.quantity
+
+        expected_summary = {
+            "total_listings" : len(listings),
+            "total_units" : sum(l.quantity for l in listings),
+            "out_of_stock" : len([l for l in listings if l.quantity == 0]),
+            "categories" : categories,
+            "manufacturers" : manufacturers
+        }
+        self.assertEqual(expected_summary, ListingManager.get_inventory_summary())
+
+    def test_14_get_inventory_summary(self):
+        self.check_inventory_summary()
+        for data in TestListingManager.EXAMPLE_DATA:
+            ListingManager.create_listing(data[0], data[1], data[2], data[3])
+            self.check_inventory_summary()
+
+        ListingManager.add_stock(ListingManager.get_listing_index("Listing 1"), 10)
+        self.check_inventory_summary()
+        ListingManager.add_stock(ListingManager.get_listing_index("Listing 2"), 5)
+        ListingManager.remove_stock(ListingManager.get_listing_index("Listing 1"), 10)
+        self.check_inventory_summary()
+        ListingManager.update_listing(ListingManager.get_listing_index("Listing 2"), "Listing 2", "", 3, 3)
+        self.check_inventory_summary()
+        ListingManager.remove_listing(ListingManager.get_listing_index("Listing 2"))
+        self.check_inventory_summary()
+        self.assertEqual(ListingManager.get_inventory_summary()["out_of_stock"], 3)
+
+    def test_15_low_stock(self):
+        quantities = [5, 0, 12, 5]
+        for data, quantity in zip(TestListingManager.EXAMPLE_DATA, quantities):
+            ListingManager.create_listing(data[0], data[1], data[2], data[3])
+            ListingManager.add_stock(ListingManager.get_listing_index(data[0]), quantity)
+        listings = ListingManager.get_all_listings()
+        by_quantity = sorted(listings, key=lambda l: (l.quantity, l.name))
+
+        for threshold in (-1, 0, 1, 5, 6, 13):
+            self.assertEqual(ListingManager.get_listings_below(threshold), [l for l in by_quantity if l.quantity < threshold])
+        for count in (0, 1, 3, 10):
+            self.assertEqual(ListingManager.get_top_listings_by_quantity(count), list(reversed(by_quantity))[:count])
+
+        #and can be paged, with or without filters
+        for offset, limit in ((0, 1), (1, 2), (2, 5), (5, 1)):
+            self.assertEqual(ListingManager.get_listings_below(13, offset=offset, limit=limit), by_quantity[offset:offset + limit])
+            self.assertEqual(ListingManager.get_listings_below(13, 0, offset=offset, limit=limit), [l for l in by_quantity if l.category == 0][offset:offset + limit])
+
+        #the index follows stock changes
+        ListingManager.remove_stock(ListingManager.get_listing_index("Listing 3"), 12)
+        self.assertEqual([l.name for l in ListingManager.get_listings_below(1)], ["Listing 2", "Listing 3"])
+
+        #listings are due to be reordered when they fall below their own threshold
+        self.assertEqual(ListingManager.get_listings_to_reorder(), [])
+        self.assertFalse(ListingManager.set_reorder_threshold(ListingManager.get_listing_index("Listing 1"), -1))
+        self.assertTrue(ListingManager.set_reorder_threshold(ListingManager.get_listing_index("Listing 1"), 5))
+        self.assertTrue(ListingManager.set_reorder_threshold(ListingManager.get_listing_index("Listing 2"), 1))
+        self.assertEqual([l.name for l in ListingManager.get_listings_to_reorder()], ["Listing 2"])
+        ListingManager.remove_stock(ListingManager.get_listing_index("Listing 1"), 1)
+        self.assertEqual([l.name for l in ListingManager.get_listings_to_reorder()], ["Listing 2", "Listing 1"])
+        self.assertEqual([l.name for l in ListingManager.get_listings_to_reorder(1, 5)], ["Listing 1"])
+        self.assertEqual([l.name for l in ListingManager.get_listings_to_reorder(0, 1)], ["Listing 2"])
+        self.assertTrue(ListingManager.set_reorder_threshold(ListingManager.get_listing_index("Listing 2"), None))
+        self.assertEqual([l.name for l in ListingManager.get_listings_to_reorder()], ["Listing 1"])
+
+        #thresholds are saved with the listing
+        reloaded = _ListingManagerInstance(TestListingManager.DUMMY_MANIFEST_FILE)
+        self.assertEqual(reloaded.get_listing(reloaded.get_listing_index("Listing 1")).reorder_threshold, 5)
+        self.assertEqual(reloaded.get_listing(reloaded.get_listing_index("Listing 2")).reorder_threshold, None)
+
+        #thresholds can be changed along with the rest of a listing, or left as they are
+        self.assertFalse(ListingManager.update_listing(ListingManager.get_listing_index("Listing 1"), "Listing 1", "", 0, 1, -1))
+        self.assertTrue(ListingManager.update_listing(ListingManager.get_listing_index("Listing 1"), "Listing 1", "", 0, 1, 2))
+        self.assertEqual(ListingManager.get_listing(ListingManager.get_listing_index("Listing 1")).reorder_threshold, 2)
+        self.assertTrue(ListingManager.update_listing(ListingManager.get_listing_index("Listing 1"), "Listing 1", "New description", 0, 1))
+        self.assertEqual(ListingManager.get_listing(ListingManager.get_listing_index("Listing 1")).reorder_threshold, 2)
+        self.assertEqual(ListingManager.get_listings_to_reorder(), [])
+
+    def test_16_query_listings_sorted(self):
+        quantities = [5, 0, 12, 5]
+        for data, quantity in zip(TestListingManager.EXAMPLE_DATA, quantities):
+            ListingManager.create_listing(data[0], data[1], data[2], data[3])
+            ListingManager.add_stock(ListingManager.get_listing_index(data[0]), quantity)
+        listings = ListingManager.get_all_listings()
+
+        sort_keys = {
+            "name" : lambda l: l.name,
+            "quantity" : lambda l: (l.quantity, l.name),
+            "category" : lambda l: (l.category, l.name),
+            "manufacturer" : lambda l: (l.manufacturer, l.name),
+        }
+        arguments = [
+            ("", -1, -1),
+            ("Listing", -1, -1),
+            ("", 0, -1),
+            ("", -1, 3),
+            ("", 0, 1)
+        ]
+        for sort_key, key in sort_keys.items():
+            for args in arguments:
+                expected_results = sorted([l for l in listings if l in ListingManager.query_listings(*args)], key=key)
+                self.assertEqual(expected_results, ListingManager.query_listings(*args, sort_key))
+                self.assertEqual(list(reversed(expected_results)), ListingManager.query_listings(*args, sort_key, True))
+
+                #pages of results
+                self.assertEqual(expected_results[1:3], ListingManager.query_listings(*args, sort_key, False, 1, 2))
+                self.assertEqual(expected_results[2:], ListingManager.query_listings(*args, sort_key, False, 2))
+                self.assertEqual(expected_results[1:3], ListingManager.query_listings_with_facets(*args, sort_key, False, 1, 2)[0])
+
+        #the order follows changes to listings
+        ListingManager.add_stock(ListingManager.get_listing_index("Listing 2"), 20)
+        self.assertEqual(ListingManager.query_listings("", -1, -1, "quantity", True)[0].name, "Listing 2")
+
+        with self.assertRaises(ValueError):
+            ListingManager.query_listings("", -1, -1, "description")
+
+    def test_17_fuzzy_query_listings(self):
+        for data in TestListingManager.EXAMPLE_DATA:
+            ListingManager.create_listing(data[0], data[1], data[2], data[3])
+        listings = ListingManager.get_all_listings()
+
+        #misspelt names still find the listing, best match first
+        self.assertEqual(ListingManager.fuzzy_query_listings("Listnig 2", -1, -1)[0], listings[1])
+        self.assertEqual(ListingManager.fuzzy_query_listings("alphabeticaly out of ordr", -1, -1), [listings[3]])
+        self.assertEqual(ListingManager.fuzzy_query_listings("Listing 3", -1, -1, 1), [listings[2]])
+        self.assertEqual(ListingManager.fuzzy_query_listings("Nothing like it", -1, -1), [])
+
+        #filters still apply
+        self.assertEqual(ListingManager.fuzzy_query_listings("Listnig", 1, -1), [listings[1]])
+        self.assertEqual(ListingManager.fuzzy_query_listings("Listnig", -1, 0), [listings[2]])
+
+        #without a name, every listing matching the filters is returned
+        self.assertEqual(ListingManager.fuzzy_query_listings("", 0, -1), ListingManager.query_listings("", 0, -1))
+
+        #the index follows renames
+        ListingManager.update_listing(ListingManager.get_listing_index("Listing 2"), "Widget", "", 1, 2)
+        self.assertEqual(ListingManager.fuzzy_query_listings("Widgit", -1, -1)[0].name, "Widget")
+        self.assertNotIn("Widget", [l.name for l in ListingManager.fuzzy_query_listings("Listnig 2", -1, -1)])
+
+        #a page of results only needs the matches up to its end. facets would need every match, so
+        #rather than counting only some of them, none are given
+        matches = ListingManager.fuzzy_query_listings("Listnig", -1, -1)
+        self.assertGreater(len(matches), 1)
+        results, facets = ListingManager.query_listings_with_facets("Listnig", -1, -1, offset=1, limit=1, fuzzy=True)
+        self.assertEqual(results, matches[1:2])
+        results, facets = ListingManager.query_listings_with_facets("Listnig", -1, -1, limit=1, fuzzy=True)
+        self.assertEqual(results, matches[:1])
+        self.assertIsNone(facets)
+        self.assertEqual(ListingManager.query_listings_with_facets("Listing", -1, -1, limit=1)[1], FacetIndex.count(ListingManager.query_listings("Listing", -1, -1)))
+
+    def test_18_autocomplete(self):
+        for data in TestListingManager.EXAMPLE_DATA:
+            ListingManager.create_listing(data[0], data[1], data[2], data[3])
+
+        #case is ignored, and names come back in alphabetical order
+        self.assertEqual(ListingManager.autocomplete("listing"), ["Listing 1", "Listing 2", "Listing 3"])
+        self.assertEqual(ListingManager.autocomplete("LISTING 2"), ["Listing 2"])
+        self.assertEqual(ListingManager.autocomplete("l", 2), ["Listing 1", "Listing 2"])
+        self.assertEqual(ListingManager.autocomplete("Alpha"), ["Alphabetically out of order"])
+        self.assertEqual(ListingManager.autocomplete("isting"), [])
+        self.assertEqual(ListingManager.autocomplete(""), [])
+
+        #the index follows changes to listings
+        ListingManager.update_listing(ListingManager.get_listing_index("Listing 2"), "Widget", "", 1, 2)
+        ListingManager.remove_listing(ListingManager.get_listing_index("Listing 3"))
+        self.assertEqual(ListingManager.autocomplete("listing"), ["Listing 1"])
+        self.assertEqual(ListingManager.autocomplete("w"), ["Widget"])
+
+    def test_19_batch_query_listings(self):
+        for data in TestListingManager.EXAMPLE_DATA:
+            ListingManager.create_listing(data[0], data[1], data[2], data[3])
+
+        queries = [
+            ("", -1, -1),
+            ("Listing", -1, -1),
+            ("listing", 0, -1),
+            ("", 0, -1),
+            ("", -1, 3),
+            (" 2", -1, 2),
+            ("", 0, 1),
+            ("Nothing", -1, -1),
+            ("", 2, -1),
+        ]
+        
+        #every query gets the same results as it would on its own
+        results = ListingManager.batch_query_listings(queries + [("Listing", -1, -1)])
+        self.assertEqual(list(results.keys()), queries)
+        for query in queries:
+            self.assertEqual(results[query], ListingManager.query_listings(*query))
+
+        results = ListingManager.batch_query_listings(queries, 1)
+        for query in queries:
+            self.assertEqual(results[query], ListingManager.query_listings(*query, limit=1))
+
+        #a limit of 0 finds nothing at all
+        self.assertEqual(ListingManager.batch_query_listings(queries, 0), {query : [] for query in queries})
+        self.assertEqual(ListingManager.batch_query_listings([]), {})
+
+    @unittest.skipUnless(numpy_available, "numpy is not installed")
+    def test_20_columnar_filters(self):
+        ListingManager.initialise(self.config_parser, columnar=True)
+        for data in TestListingManager.EXAMPLE_DATA:
+            ListingManager.create_listing(data[0], data[1], data[2], data[3])
+            ListingManager.add_stock(ListingManager.get_listing_index(data[0]), data[4])
+        
+        def check_queries():
+            #the same catalog without the column index
+            plain = _ListingManagerInstance(TestListingManager.DUMMY_MANIFEST_FILE)
+            for sort_key in ("name", "quantity", "category", "manufacturer"):
+                for item_category in (-1, 0, 1, 3):
+                    for item_manufacturer in (-1, 0, 1, 2, 3):
+                        for descending in (False, True):
+                            args = ("", item_category, item_manufacturer, sort_key, descending)
+                            self.assertEqual(ListingManager.query_listings(*args), plain.query_listings(*args))
+                            self.assertEqual(ListingManager.query_listings("listing", *args[1:]), plain.query_listings("listing", *args[1:]))
+
+            for threshold in (0, 1, 124, 201):
+                for item_category in (-1, 0, 1, 3):
+                    for item_manufacturer in (-1, 0, 2):
+                        self.assertEqual(
+                            ListingManager.get_listings_below(threshold, item_category, item_manufacturer), 
+                            plain.get_listings_below(threshold, item_category, item_manufacturer)
+                        )
+        
+        check_queries()
+        self.assertEqual([l.name for l in ListingManager.get_listings_below(150, 1)], ["Listing 2"])
+
+        #rows are kept in sync as listings change and are removed
+        ListingManager.update_listing(ListingManager.get_listing_index("Listing 2"), "Listing 2", "", 3, 0)
+        ListingManager.remove_listing(ListingManager.get_listing_index("Listing 1"))
+        ListingManager.remove_stock(ListingManager.get_listing_index("Listing 3"), 150)
+        check_queries()
+        self.assertEqual([l.name for l in ListingManager.get_listings_below(150, 3)], ["Listing 3", "Listing 2"])
+
+    def test_21_listing_ids(self):
+        #catalogs saved before listings had ids are migrated when they are loaded
+        directory = os.path.dirname(TestListingManager.DUMMY_MANIFEST_FILE)
+        manifest = {"listings" : []}
+        for data in TestListingManager.EXAMPLE_DATA[:2]:
+            file_name = _ListingManagerInstance.hash(data[0]) + ".json"
+            with open(os.path.join(directory, file_name), "w") as f:
+                json.dump(Listing(*data).as_dict(), f)
+            manifest["listings"].append(file_name)
+        with open(TestListingManager.DUMMY_MANIFEST_FILE, "w") as f:
+            json.dump(manifest, f)
+        
+        #read-only followers can't migrate, but give out the same ids
+        follower = _ListingManagerInstance(TestListingManager.DUMMY_MANIFEST_FILE, read_only=True)
+        self.assertEqual([l.id for l in follower.get_all_listings()], [0, 1])
+
+        ListingManager.initialise(self.config_parser)
+        self.assertEqual([l.id for l in ListingManager.get_all_listings()], [0, 1])
+        self.assertEqual(ListingManager.get_listing_by_id(1).name, "Listing 2")
+        self.assertEqual(ListingManager.get_listing_index_by_id(1), ListingManager.get_listing_index("Listing 2"))
+        self.assertIsNone(ListingManager.get_listing_by_id(2))
+        for file_name in manifest["listings"]:
+            self.assertFalse(os.path.exists(os.path.join(directory, file_name)))
+        self.assertEqual(ListingManager._ListingManager__instance.read_manifest(), {"listings" : ["0.json", "1.json"], "next_id" : 2})
+
+        #followers reload after the migration, to find the new files
+        self.assertTrue(follower.refresh())
+        self.assertIsNone(follower.legacy_ids)
+        self.assertEqual(follower.file_name(1), "1.json")
+        self.assertEqual(follower.get_all_listings(), ListingManager.get_all_listings())
+
+        #renaming a listing keeps its id and its file
+        ListingManager.update_listing(ListingManager.get_listing_index_by_id(0), "Renamed", "", 0, 0)
+        with open(os.path.join(directory, "0.json"), "r") as f:
+            self.assertEqual(json.load(f)["name"], "Renamed")
+        self.assertEqual(ListingManager.get_listing_index("Listing 1"), -1)
+        self.assertEqual(ListingManager.get_listing_by_id(0).name, "Renamed")
+        self.assertFalse(ListingManager.update_listing(ListingManager.get_listing_index_by_id(0), "Listing 2", "", 0, 0))
+
+        #ids are never given out twice, even across restarts
+        ListingManager.remove_listing(ListingManager.get_listing_index_by_id(1))
+        ListingManager.create_listing("Listing 5", "", 0, 0)
+        self.assertEqual(ListingManager.get_listing(ListingManager.get_listing_index("Listing 5")).id, 2)
+        ListingManager.initialise(self.config_parser)
+        ListingManager.create_listing("Listing 6", "", 0, 0)
+        self.assertEqual(ListingManager.get_listing(ListingManager.get_listing_index("Listing 6")).id, 3)
+        self.assertEqual([l.id for l in ListingManager.get_all_listings()], [0, 2, 3])
+
+        #positions stay correct as listings are removed
+        ListingManager.remove_listing(ListingManager.get_listing_index_by_id(0))
+        self.assertEqual(ListingManager.get_listing_index_by_id(2), 0)
+        self.assertEqual(ListingManager.get_listing_index_by_id(3), 1)
+        self.assertEqual(ListingManager.get_listing_index_by_id(0), -1)
+
+    def test_22_listeners(self):
+        events = []
+        ListingManager.add_listener(events.append)
+        follower = _ListingManagerInstance(TestListingManager.DUMMY_MANIFEST_FILE, read_only=True)
+        follower_events = []
+        follower.add_listener(follower_events.append)
+
+        ListingManager.create_listing("Listing 1", "", 1, 2)
+        ListingManager.add_stock(ListingManager.get_listing_index("Listing 1"), 5)
+        ListingManager.update_listing(ListingManager.get_listing_index("Listing 1"), "Renamed", "", 0, 1)
+        self.assertFalse(ListingManager.remove_stock(ListingManager.get_listing_index("Renamed"), 10))
+        ListingManager.remove_listing(ListingManager.get_listing_index("Renamed"))
+        self.assertEqual(events, [
+            {"op" : "created", "id" : 0, "name" : "Listing 1", "category" : 1, "manufacturer" : 2, "quantity" : 0},
+            {"op" : "updated", "id" : 0, "name" : "Listing 1", "category" : 1, "manufacturer" : 2, "quantity" : 5},
+            {"op" : "updated", "id" : 0, "name" : "Renamed", "category" : 0, "manufacturer" : 1, "quantity" : 5, "previous_category" : 1, "previous_manufacturer" : 2},
+            {"op" : "removed", "id" : 0, "name" : "Renamed", "category" : 0, "manufacturer" : 1, "quantity" : 5},
+        ])
+
+        #changes made by other processes are announced as they are applied
+        follower.refresh()
+        self.assertEqual(follower_events, events)
+
+        #if the log is started again before a follower reads it, it can only start again too
+        ListingManager._ListingManager__instance.changelog.reset()
+        ListingManager.create_listing("Listing 2", "", 0, 0)
+        follower.refresh()
+        self.assertEqual(follower_events[-1], {"op" : "reset"})
+
+        ListingManager.remove_listener(events.append)
+        ListingManager.create_listing("Listing 3", "", 0, 0)
+        self.assertEqual(len(events), 5)
+
+    def test_23_stock_history(self):
+        start = time.time()
+        for data in TestListingManager.EXAMPLE_DATA[:2]:
+            ListingManager.create_listing(data[0], data[1], data[2], data[3])
+        first = ListingManager.get_listing(ListingManager.get_listing_index("Listing 1"))
+        second = ListingManager.get_listing(ListingManager.get_listing_index("Listing 2"))
+
+        ListingManager.add_stock(ListingManager.get_listing_index("Listing 1"), 10)
+        ListingManager.add_stock(ListingManager.get_listing_index("Listing 2"), 3)
+        ListingManager.remove_stock(ListingManager.get_listing_index("Listing 1"), 4)
+        self.assertFalse(ListingManager.remove_stock(ListingManager.get_listing_index("Listing 2"), 4))
+        
+        history = ListingManager.get_stock_history(first.id)
+        self.assertEqual([(r["change"], r["quantity"]) for r in history], [(10, 10), (-4, 6)])
+        self.assertTrue(all(r["id"] == first.id and r["time"] >= start for r in history))
+        self.assertEqual([r["id"] for r in ListingManager.get_stock_history()], [first.id, second.id, first.id])
+
+        #time ranges
+        self.assertEqual(ListingManager.get_stock_history(first.id, history[1]["time"]), history[1:])
+        self.assertEqual(ListingManager.get_stock_history(first.id, None, history[1]["time"]), history[:1])
+        self.assertEqual(ListingManager.get_stock_history(first.id, time.time() + 60), [])
+
+        #history is kept across restarts, and read by followers
+        follower = _ListingManagerInstance(TestListingManager.DUMMY_MANIFEST_FILE, read_only=True)
+        self.assertEqual(follower.get_stock_history(first.id), history)
+
+    def test_24_lazy_descriptions(self):
+        ListingManager.initialise(self.config_parser, lazy_descriptions=True)
+        instance = ListingManager._ListingManager__instance
+        instance.descriptions.size = 2
+        for data in TestListingManager.EXAMPLE_DATA:
+            ListingManager.create_listing(data[0], data[1], data[2], data[3])
+        plain = _ListingManagerInstance(TestListingManager.DUMMY_MANIFEST_FILE)
+
+        #descriptions are left out of the listings, and only the most recently used are kept
+        self.assertEqual(ListingManager.get_all_listings(), plain.get_all_listings())
+        self.assertTrue(all(Listing.description.__get__(l) is None for l in ListingManager.get_all_listings()))
+        self.assertEqual(list(instance.descriptions.descriptions.values()), ["Description 3", "Description 4"])
+
+        #and are loaded again from the listing files
+        instance = _ListingManagerInstance(TestListingManager.DUMMY_MANIFEST_FILE, lazy_descriptions=True)
+        self.assertEqual(len(instance.descriptions.descriptions), 0)
+        self.assertEqual(instance.get_listing(instance.get_listing_index("Listing 2")).description, "Description 2")
+        self.assertEqual(instance.get_all_listings(), plain.get_all_listings())
+
+        #changes are saved before the description is forgotten
+        instance.update_listing(instance.get_listing_index("Listing 2"), "Listing 2", "Changed", 1, 2)
+        instance.add_stock(instance.get_listing_index("Listing 2"), 5)
+        instance.descriptions.clear()
+        self.assertEqual(instance.get_listing(instance.get_listing_index("Listing 2")).description, "Changed")
+
+        #removed listings keep their description
+        removed = instance.remove_listing(instance.get_listing_index("Listing 1"))
+        self.assertEqual(removed.description, "Description 1")
+
+        #other processes' changes are picked up
+        ListingManager.refresh()
+        self.assertEqual(ListingManager.get_listing(ListingManager.get_listing_index("Listing 2")).description, "Changed")
+        self.assertEqual(ListingManager.get_listing_index("Listing 1"), -1)
+
+    def test_25_durability(self):
+        with self.assertRaises(ValueError):
+            ListingManager.initialise(self.config_parser, durability="sometimes")
+
+        #periodic writes are synced once the interval has passed, or when flushed
+        ListingManager.initialise(self.config_parser, durability="periodic")
+        durability = ListingManager._ListingManager__instance.durability
+        durability.interval = 60
+        ListingManager.create_listing("Listing 1", "", 0, 0)
+        ListingManager.add_stock(ListingManager.get_listing_index("Listing 1"), 3)
+        self.assertIn(TestListingManager.DUMMY_MANIFEST_FILE, durability.pending)
+        self.assertIn(TestListingManager.DUMMY_MANIFEST_FILE + ".changes", durability.pending)
+        ListingManager.flush()
+        self.assertEqual(durability.pending, set())
+
+        durability.interval = 0
+        ListingManager.remove_listing(ListingManager.get_listing_index("Listing 1"))
+        self.assertEqual(durability.pending, set())
+
+        #in the other modes, nothing is left waiting to be synced
+        for mode in ("always", "buffered"):
+            ListingManager.initialise(self.config_parser, durability=mode)
+            ListingManager.create_listing("Listing 2", "", 0, 0)
+            ListingManager.add_stock(ListingManager.get_listing_index("Listing 2"), 3)
+            ListingManager.remove_listing(ListingManager.get_listing_index("Listing 2"))
+            self.assertEqual(ListingManager._ListingManager__instance.durability.pending, set())
+
+    def test_26_sharded_layout(self):
+        directory = os.path.dirname(TestListingManager.DUMMY_MANIFEST_FILE)
+        for data in TestListingManager.EXAMPLE_DATA[:3]:
+            ListingManager.create_listing(data[0], data[1], data[2], data[3])
+        listings = ListingManager.get_all_listings()
+
+        def subdirectories():
+            return sorted(f for f in os.listdir(directory) if os.path.isdir(os.path.join(directory, f)) and len(f) == 2)
+
+        #as if a previous attempt had been interrupted part way through
+        os.makedirs(os.path.join(directory, os.path.dirname(_ListingManagerInstance.shard("1.json", 2))))
+        os.replace(os.path.join(directory, "1.json"), os.path.join(directory, _ListingManagerInstance.shard("1.json", 2)))
+
+        #existing catalogs are moved to the new layout when opened
+        ListingManager.initialise(self.config_parser, shard_levels=2)
+        manifest = ListingManager._ListingManager__instance.read_manifest()
+        self.assertEqual(manifest["shard_levels"], 2)
+        self.assertEqual(manifest["listings"], [_ListingManagerInstance.shard(f"{i}.json", 2) for i in range(3)])
+        for file_name in manifest["listings"]:
+            self.assertEqual(len(file_name.split("/")), 3)
+            self.assertTrue(os.path.exists(os.path.join(directory, file_name)))
+        self.assertFalse(os.path.exists(os.path.join(directory, "0.json")))
+        self.assertEqual(ListingManager.get_all_listings(), listings)
+
+        #changes are made in the new layout, and followers find it from the manifest
+        ListingManager.create_listing("Listing 4", "", 0, 0)
+        ListingManager.add_stock(ListingManager.get_listing_index("Listing 1"), 4)
+        self.assertTrue(os.path.exists(os.path.join(directory, _ListingManagerInstance.shard("3.json", 2))))
+        follower = _ListingManagerInstance(TestListingManager.DUMMY_MANIFEST_FILE, read_only=True)
+        self.assertEqual(follower.get_all_listings(), ListingManager.get_all_listings())
+        self.assertEqual(follower.get_listing_by_id(3).name, "Listing 4")
+
+        #and can be moved back again
+        ListingManager.initialise(self.config_parser)
+        self.assertEqual(ListingManager._ListingManager__instance.read_manifest()["listings"], ["0.json", "1.json", "2.json", "3.json"])
+        self.assertEqual(subdirectories(), [])
+        self.assertEqual(ListingManager.get_listing(ListingManager.get_listing_index("Listing 1")).quantity, 4)
+
+        #followers reload after the move
+        follower.refresh()
+        self.assertEqual(follower.shard_levels, 0)
+        self.assertEqual(follower.get_all_listings(), ListingManager.get_all_listings())
+
+        with self.assertRaises(ValueError):
+            ListingManager.initialise(self.config_parser, shard_levels=4)
+
+    def test_27_file_watcher(self):
+        directory = os.path.dirname(TestListingManager.DUMMY_MANIFEST_FILE)
+        ListingManager.initialise(self.config_parser, watch=True)
+        for data in TestListingManager.EXAMPLE_DATA[:3]:
+            ListingManager.create_listing(data[0], data[1], data[2], data[3])
+        events = []
+        ListingManager.add_listener(events.append)
+
+        #our own changes are ignored
+        ListingManager.add_stock(ListingManager.get_listing_index("Listing 1"), 5)
+        self.assertFalse(ListingManager.check_files())
+
+        def write_file(file_name, data):
+            with open(os.path.join(directory, file_name), "w") as f:
+                json.dump(data, f)
+
+        #only the listings whose files changed are loaded again
+        write_file("1.json", Listing("Listing 2", "Edited by hand", 1, 2, 50, id=1).as_dict())
+        self.assertTrue(ListingManager.check_files())
+        self.assertEqual(ListingManager.get_listing_by_id(1).quantity, 50)
+        self.assertEqual(ListingManager.query_listings("", -1, -1, "quantity", True)[0].name, "Listing 2")
+        self.assertEqual(events[-1]["op"], "updated")
+        self.assertFalse(ListingManager.check_files())
+
+        #broken files, and names which are already taken, are skipped
+        with open(os.path.join(directory, "1.json"), "w") as f:
+            f.write("{")
+        self.assertFalse(ListingManager.check_files())
+        write_file("1.json", Listing("Listing 1", "Edited by hand", 1, 2, 50, id=1).as_dict())
+        self.assertFalse(ListingManager.check_files())
+        self.assertEqual(ListingManager.get_listing_by_id(1).name, "Listing 2")
+
+        os.remove(os.path.join(directory, "2.json"))
+        self.assertTrue(ListingManager.check_files())
+        self.assertIsNone(ListingManager.get_listing_by_id(2))
+        self.assertEqual(events[-1], {"op" : "removed", "id" : 2, "name" : "Listing 3", "category" : 3, "manufacturer" : 0, "quantity" : 0})
+
+        #the manifest decides which listings there are
+        write_file("7.json", Listing("Listing 8", "Added by hand", 0, 0, 1).as_dict())
+        write_file(os.path.basename(TestListingManager.DUMMY_MANIFEST_FILE), {"listings" : ["1.json", "7.json"], "next_id" : 3})
+        self.assertTrue(ListingManager.check_files())
+        self.assertEqual(sorted(l.id for l in ListingManager.get_all_listings()), [1, 7])
+        self.assertEqual(ListingManager.get_listing_by_id(7).name, "Listing 8")
+
+        #new listings don't reuse the ids of listings added by hand
+        ListingManager.create_listing("Listing 9", "", 0, 0)
+        self.assertEqual(ListingManager.get_listing(ListingManager.get_listing_index("Listing 9")).id, 8)
+        self.assertFalse(ListingManager.check_files())
+
+        #the files can be polled elsewhere, such as on another thread, and the changes applied afterwards
+        stats = ListingManager.stat_files(ListingManager.watched_files())
+        write_file("1.json", Listing("Listing 2", "Edited again", 1, 2, 60, id=1).as_dict())
+        self.assertFalse(ListingManager.check_files(stats))
+        stats = ListingManager.stat_files(ListingManager.watched_files())
+        self.assertTrue(ListingManager.check_files(stats))
+        self.assertEqual(ListingManager.get_listing_by_id(1).quantity, 60)
+
+        #a new layout chosen by another tool is followed, rather than moved back
+        _ListingManagerInstance(TestListingManager.DUMMY_MANIFEST_FILE, shard_levels=1)
+        ListingManager.check_files()
+        self.assertEqual(events[-1], {"op" : "reset"})
+        self.assertEqual(ListingManager._ListingManager__instance.read_manifest()["shard_levels"], 1)
+        self.assertTrue(os.path.exists(os.path.join(directory, _ListingManagerInstance.shard("1.json", 1))))
+        self.assertEqual(ListingManager.get_listing_by_id(1).quantity, 60)
+        self.assertFalse(ListingManager.check_files())
+        ListingManager.add_stock(ListingManager.get_listing_index("Listing 2"), 1)
+        self.assertTrue(os.path.exists(os.path.join(directory, _ListingManagerInstance.shard("1.json", 1))))
+        _ListingManagerInstance(TestListingManager.DUMMY_MANIFEST_FILE)
+        ListingManager.check_files()
+        self.assertEqual(ListingManager.get_listing_by_id(1).quantity, 61)
+        self.assertTrue(os.path.exists(os.path.join(directory, "1.json")))
+        ListingManager.remove_listener(events.append)
+        os.remove(os.path.join(directory, "0.json"))
+
+    def test_28_memory_subsystems(self):
+        for data in TestListingManager.EXAMPLE_DATA:
+            ListingManager.create_listing(data[0], data[1], data[2], data[3])
+
+        #listings come first, so the indexes can be measured without them
+        subsystems = ListingManager.memory_subsystems()
+        names = [name for name, _ in subsystems]
+        self.assertEqual(names[0], "listings")
+        self.assertEqual(len(names), len(set(names)))
+        self.assertEqual(subsystems[0][1], ListingManager.get_all_listings())
+        self.assertIn("trigrams", names)
+
+    def test_29_interrupted_migration(self):
+        directory = os.path.dirname(TestListingManager.DUMMY_MANIFEST_FILE)
+        manifest = {"listings" : []}
+        for data in TestListingManager.EXAMPLE_DATA[:3]:
+            file_name = _ListingManagerInstance.hash(data[0]) + ".json"
+            with open(os.path.join(directory, file_name), "w") as f:
+                json.dump(Listing(*data).as_dict(), f)
+            manifest["listings"].append(file_name)
+        with open(TestListingManager.DUMMY_MANIFEST_FILE, "w") as f:
+            json.dump(manifest, f)
+
+        class Interrupted(Exception):
+            pass
+
+        class InterruptedManager(_ListingManagerInstance):
+            #stops part way through the migration, as if the process had died
+            def save_listing(self, listing, path = None):
+                if listing.id == 1:
+                    raise Interrupted()
+                super().save_listing(listing, path)
+
+        with self.assertRaises(Interrupted):
+            InterruptedManager(TestListingManager.DUMMY_MANIFEST_FILE)
+        self.assertEqual(_ListingManagerInstance(TestListingManager.DUMMY_MANIFEST_FILE, read_only=True).read_manifest(), manifest)
+        for file_name in manifest["listings"]:
+            self.assertTrue(os.path.exists(os.path.join(directory, file_name)))
+
+        #the migration starts again next time, and no listing is lost
+        ListingManager.initialise(self.config_parser)
+        self.assertEqual([l.name for l in ListingManager.get_all_listings()], [data[0] for data in TestListingManager.EXAMPLE_DATA[:3]])
+        self.assertEqual(ListingManager._ListingManager__instance.read_manifest(), {"listings" : ["0.json", "1.json", "2.json"], "next_id" : 3})
+        for file_name in manifest["listings"]:
+            self.assertFalse(os.path.exists(os.path.join(directory, file_name)))
+
+    def test_30_bulk_loaded_indexes(self):
+        #enough listings that the sorted indexes are sorted all at once when loaded
+        for i in range(50):
+            ListingManager.create_listing(f"Listing {(i * 17) % 50:02}", "", i % 3, i % 2)
+            ListingManager.add_stock(ListingManager.get_listing_index(f"Listing {(i * 17) % 50:02}"), (i * 7) % 11)
+        ListingManager.initialise(self.config_parser)
+
+        expected = sorted(ListingManager.get_all_listings(), key=lambda l: (l.quantity, l.name))
+        self.assertEqual(ListingManager.query_listings("", -1, -1, "quantity"), expected)
+        self.assertEqual([l.name for l in ListingManager.query_listings("", -1, -1)], [f"Listing {i:02}" for i in range(50)])
+        self.assertEqual(ListingManager.autocomplete("listing 4", 3), ["Listing 40", "Listing 41", "Listing 42"])
+
+        #and kept in order as listings change afterwards
+        ListingManager.add_stock(ListingManager.get_listing_index(expected[0].name), 100)
+        self.assertEqual(ListingManager.get_top_listings_by_quantity(1)[0].name, expected[0].name)
+        self.assertEqual(ListingManager.query_listings("", -1, -1, "quantity")[:-1], expected[1:])
+
+
     #TODO test that categories and manufacturers are being correctly parsed
     #NOTE actually no don't do that, just talk about it instead
\ No newline at end of file
@@ -0,0 +1,69 @@
+import unittest
+import os
+import time
+
+from listingmanager import Registry
+
+
+class TestRegistry(unittest.TestCase):
+    DUMMY_REGISTRY_FILE = "test_temp_data/registry.txt"
+
+    EXAMPLE_NAMES = ["Name 1", "", "Name 2", "Name 1", "  Name 3  "]
+    EXPECTED_NAMES = {0 : "Default", 1 : "Name 1", 2 : "Name 2", 3 : "Name 3"}
+
+    def setUp(self):
+        with open(TestRegistry.DUMMY_REGISTRY_FILE, "w") as f:
+            f.write("\n".join(TestRegistry.EXAMPLE_NAMES))
+
+        self.registry = Registry("Default")
+        self.registry.parse(TestRegistry.DUMMY_REGISTRY_FILE)
+
+    def tearDown(self):
+        if os.path.exists(TestRegistry.DUMMY_REGISTRY_FILE):
+            os.remove(TestRegistry.DUMMY_REGISTRY_FILE)
+
+
+    def test_0_parse(self):
+        self.assertEqual(TestRegistry.EXPECTED_NAMES, self.registry)
+
+        missing = Registry("Default")
+        missing.parse("test_temp_data/doesn't exist.txt")
+        self.assertEqual({0 : "Default"}, missing)
+
+    def test_1_get_id(self):
+        for index, name in TestRegistry.EXPECTED_NAMES.items():
+            self.assertEqual(index, self.registry.get_id(name))
+            self.assertEqual(index, self.registry.get_id(f" {name} "))
+        self.assertEqual(-1, self.registry.get_id("Name 4"))
+
+    def test_2_add(self):
+        self.assertEqual(1, self.registry.add("Name 1"))
+        self.assertEqual(4, self.registry.add(" Name 4 "))
+        self.assertEqual(4, self.registry.get_id("Name 4"))
+        with self.assertRaises(ValueError):
+            self.registry.add("   ")
+
+        #added names are saved, keeping their ids
+        reparsed = Registry("Default")
+        reparsed.parse(TestRegistry.DUMMY_REGISTRY_FILE)
+        self.assertEqual(self.registry, reparsed)
+
+        #our own additions don't count as changes to the file
+        self.assertFalse(self.registry.reload_if_changed())
+
+    def test_3_reload_if_changed(self):
+        self.assertFalse(self.registry.reload_if_changed())
+
+        #another process adds a name
+        other = Registry("Default")
+        other.parse(TestRegistry.DUMMY_REGISTRY_FILE)
+        time.sleep(0.01)
+        self.assertEqual(4, other.add("Name 4"))
+
+        self.assertTrue(self.registry.reload_if_changed())
+        self.assertEqual(4, self.registry.get_id("Name 4"))
+
+        #names added after that don't collide with the other process's ids
+        self.assertEqual(5, self.registry.add("Name 5"))
+        self.assertEqual(4, other.add("Name 4"))
+        self.assertEqual(5, other.get_id("Name 5"))
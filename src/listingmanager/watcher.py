@@ -0,0 +1,47 @@
+import os
+
+
+class FileWatcher:
+    #notices files which have been created, changed or removed since they were last seen, by
+    #polling their size, modification time and identity. no other services are needed
+    def __init__(self):
+        self.stats = {}
+
+    @staticmethod
+    def stat(path):
+        try:
+            stat = os.stat(path)
+            return stat.st_mtime_ns, stat.st_size, stat.st_ino
+        except FileNotFoundError:
+            return None
+
+    def seen(self, name, path):
+        #remember the state of a file, so that only changes made after this are noticed.
+        #files are remembered by name, which may be shorter than their path
+        self.stats[name] = FileWatcher.stat(path)
+
+    def forget(self, name):
+        self.stats.pop(name, None)
+
+    def clear(self):
+        self.stats.clear()
+
+    def changed(self, name, path):
+        #whether a file has changed since it was last seen. a file never seen has always changed
+        stat = FileWatcher.stat(path)
+        if name in self.stats and self.stats[name] == stat:
+            return False
+
+        self.stats[name] = stat
+        return True
+
+    def changes(self, stats):
+        #names of the files whose stats, which may have been taken on another thread, differ from
+        #when they were last seen. files no longer watched, such as those since forgotten, are skipped
+        changed = [name for name, stat in stats.items() if self.stats.get(name, stat) != stat]
+        for name in changed:
+            self.stats[name] = stats[name]
+        return changed
+
+    def names(self):
+        return list(self.stats.keys())
@@ -1,32 +1,173 @@
+import time
+STARTED = time.perf_counter()
+
 import argparse
+import asyncio
+import contextlib
 import sys
+import os
+import signal
+import socket
 import configparser
 
-from aiohttp import web
+#the listing manager and website (with aiohttp and jinja) take a while to import, so they
+#are only imported by main, once the config has been read and the catalog is being loaded
 
-from website import Website
-from listingmanager import ListingManager
 
+class StartupReport:
+    #how long each step of starting up took, so that slow starts can be tracked down
+    def __init__(self):
+        self.steps = []
+        self.listening_after = None
 
+    @contextlib.contextmanager
+    def timed(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps.append((name, time.perf_counter() - start))
 
-def main(args, config):
-    #pre-initialise the listing manager so it is ready as needed 
-    ListingManager.initialise(config)
+    def listening(self):
+        self.listening_after = time.perf_counter() - STARTED
 
-    #create the website server
-    app = Website(args.templates_path)
+    def print(self):
+        print("Startup report:")
+        for name, elapsed in self.steps:
+            print(f"    {name:<32}{elapsed * 1000:9.1f}ms")
+        if self.listening_after is not None:
+            print(f"    {'Listening after':<32}{self.listening_after * 1000:9.1f}ms")
 
-    #start the website
-    web.run_app(app)
 
-if __name__ == "__main__":
+def main(args, config, report):
+    with report.timed("Import listing manager"):
+        from listingmanager import ListingManager
+
+    workers = int(args.workers)
+    if workers > 1 and not hasattr(os, "fork"):
+        print("[[WARNING]] - Multiple workers are not supported on this platform. Running a single worker.")
+        workers = 1
+
+    #pre-initialise the listing manager so it is ready as needed. with several workers
+    #the catalog is shared between processes and kept in sync through its change log.
+    #read-only followers never write, so they have no need to coordinate writes
+    #with background loading, listings are parsed after the server has started
+    ListingManager.initialise(
+        config, 
+        shared = workers > 1 and not args.read_only, 
+        read_only = args.read_only,
+        background_load = args.background_load,
+        columnar = args.columnar,
+        trusted_load = args.trusted_load,
+        lazy_descriptions = args.lazy_descriptions,
+        durability = args.durability,
+        shard_levels = int(args.shard_levels),
+        watch = args.watch_files,
+        timed = report.timed
+    )
+
+    with report.timed("Import website"):
+        from website import Website
+
+    if workers == 1:
+        #create and start the website server
+        with report.timed("Create website"):
+            app = Website(args.templates_path, args.static_path)
+        asyncio.run(serve(app, report if args.startup_report else None, host=args.host, port=int(args.port)))
+    else:
+        run_workers(args, workers, report)
+
+async def serve(app, report = None, host = None, port = None, sock = None):
+    #run the website until interrupted, like aiohttp's run_app. the steps of starting it are
+    #timed for the report, and templates are compiled once it is already listening
+    from aiohttp import web
+
+    printing = report is not None
+    report = StartupReport() if report is None else report
+    runner = web.AppRunner(app)
+    with report.timed("Start website"):
+        await runner.setup()
+    with report.timed("Bind socket"):
+        site = web.TCPSite(runner, host, port) if sock is None else web.SockSite(runner, sock)
+        await site.start()
+    report.listening()
+
+    if sock is None:
+        print(f"======== Running on http://{host}:{port} ========")
+        print("(Press CTRL+C to quit)")
+    with report.timed("Compile templates (listening)"):
+        app.preload_templates()
+    if printing:
+        report.print()
+
+    #stop cleanly when asked to by the process running us, as on an interrupt
+    stopped = asyncio.Event()
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stopped.set)
+    except NotImplementedError: #pragma: no cover
+        pass #signal handlers are not supported on windows
+    try:
+        await stopped.wait()
+    finally:
+        await runner.cleanup()
+
+def run_workers(args, workers, report):
+    #bind the listening socket once so that every worker accepts connections from it
+    with report.timed("Bind socket"):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((args.host, int(args.port)))
+        sock.listen(128)
+    report.listening()
+    print(f"Serving on http://{args.host}:{args.port} with {workers} workers")
+    if args.startup_report:
+        report.print()
+
+    from website import Website
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            #each worker gets its own event loop and website, but inherits the loaded catalog
+            try:
+                app = Website(args.templates_path, args.static_path)
+                asyncio.run(serve(app, sock=sock))
+            finally:
+                os._exit(0)
+        children.append(pid)
+    sock.close()
+
+    try:
+        for pid in children:
+            os.waitpid(pid, 0)
+    except KeyboardInterrupt:
+        #the workers receive the interrupt too, so just wait for them to finish
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        raise
+
+def read_config():
     #get the config values which also have command line arguments
     config = configparser.ConfigParser()
     config.read("Resources/config.cfg")
 
     jinja_path = config.get("Operation", "JinjaTemplatesPath")
-    hostname = config.get("Website", "Hostname")
+    static_path = config.get("Operation", "StaticPath", fallback="Resources/static/")
+    hostname = config.get("Website", "Hostname").strip("\"")
     port = config.get("Website", "Port")
+    workers = config.get("Website", "Workers", fallback="1")
+    read_only = config.getboolean("Listings", "ReadOnly", fallback=False)
+    background_load = config.getboolean("Listings", "BackgroundLoad", fallback=False)
+    columnar = config.getboolean("Listings", "Columnar", fallback=False)
+    trusted_load = config.getboolean("Listings", "TrustedLoad", fallback=False)
+    lazy_descriptions = config.getboolean("Listings", "LazyDescriptions", fallback=False)
+    durability = config.get("Listings", "Durability", fallback="buffered")
+    shard_levels = config.get("Listings", "ShardLevels", fallback="0")
+    watch_files = config.getboolean("Listings", "WatchFiles", fallback=False)
 
     #parse command line arguments. any provided will take priority over the config values
     parser = argparse.ArgumentParser(
@@ -34,9 +175,26 @@ if __name__ == "__main__":
                     description='Hosts a web interface and local dashboard for managing stock inventory.',
                     )
     parser.add_argument("--templates-path", default=jinja_path)
+    parser.add_argument("--static-path", default=static_path)
     parser.add_argument("--host", default=hostname)
     parser.add_argument("--port", default=port)
+    parser.add_argument("--workers", default=workers, help="Number of server processes sharing the listening socket")
+    parser.add_argument("--read-only", action="store_true", default=read_only, help="Only serve searches, following changes made by another server")
+    parser.add_argument("--background-load", action="store_true", default=background_load, help="Start serving before every listing has been loaded")
+    parser.add_argument("--columnar", action="store_true", default=columnar, help="Filter very large catalogs with numpy, if it is installed")
+    parser.add_argument("--trusted-load", action="store_true", default=trusted_load, help="Load listing files without validating them again")
+    parser.add_argument("--lazy-descriptions", action="store_true", default=lazy_descriptions, help="Leave listing descriptions on disk until they are shown")
+    parser.add_argument("--durability", default=durability, choices=["always", "periodic", "buffered"], help="Sync every write to disk before responding, sync once a second, or leave it to the operating system")
+    parser.add_argument("--shard-levels", default=shard_levels, help="Levels of subdirectories to spread listing files over. Existing catalogs are moved to match")
+    parser.add_argument("--watch-files", action="store_true", default=watch_files, help="Pick up changes made to listing files by other tools without restarting")
+    parser.add_argument("--startup-report", action="store_true", help="Print how long each step of starting up took")
     args = parser.parse_args()
+    return args, config
+
+if __name__ == "__main__":
+    report = StartupReport()
+    with report.timed("Read config"):
+        args, config = read_config()
 
     if len(sys.argv) > 1: #we still accept one argument as main.py must be passed to python
         print(len(sys.argv))
@@ -44,6 +202,6 @@ if __name__ == "__main__":
 
     #don't show an error to the console when ending the application at the command line
     try:
-        main(args, config)
+        main(args, config, report)
     except KeyboardInterrupt:
-        quit(0)
\ No newline at end of file
+        quit(0)
@@ -0,0 +1,57 @@
+import asyncio
+
+
+class AdmissionControl:
+    #bounds the number of requests handled at once. those beyond the limit wait their turn,
+    #up to queue_limit of them, and any more are turned away straight away
+    def __init__(self, in_flight_limit: int, queue_limit: int):
+        self.in_flight_limit = in_flight_limit
+        self.queue_limit = queue_limit
+        self.slots = asyncio.Semaphore(in_flight_limit)
+
+        self.in_flight = 0
+        self.queued = 0
+
+        #totals since the server started
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    async def run(self, handler, request, timeout: float):
+        #the result of handler, or None if it was turned away. raises asyncio.TimeoutError
+        #if it wasn't finished within timeout seconds, including any time spent waiting
+        if self.slots.locked() and self.queued >= self.queue_limit:
+            self.rejected += 1
+            return None
+
+        deadline = asyncio.get_running_loop().time() + timeout
+        self.queued += 1
+        try:
+            await asyncio.wait_for(self.slots.acquire(), timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise
+        finally:
+            self.queued -= 1
+
+        self.admitted += 1
+        self.in_flight += 1
+        try:
+            return await asyncio.wait_for(handler(request), max(0, deadline - asyncio.get_running_loop().time()))
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            self.slots.release()
+
+    def metrics(self) -> dict:
+        return {
+            "in_flight" : self.in_flight,
+            "queued" : self.queued,
+            "in_flight_limit" : self.in_flight_limit,
+            "queue_limit" : self.queue_limit,
+            "admitted" : self.admitted,
+            "rejected" : self.rejected,
+            "timed_out" : self.timed_out,
+        }
@@ -0,0 +1,88 @@
+import asyncio
+
+
+class FeedSubscriber:
+    def __init__(self, item_category: int, item_manufacturer: int, limit: int):
+        self.item_category = item_category
+        self.item_manufacturer = item_manufacturer
+        self.limit = limit
+
+        #events waiting to be sent, by listing id. a listing which changes again before its
+        #event is sent only needs its latest state, so slow clients get fewer, newer events
+        self.pending = {}
+        self.overflowed = False
+        self.closed = False
+        self.ready = asyncio.Event()
+
+    def matches(self, event) -> bool:
+        for field, wanted in (("category", self.item_category), ("manufacturer", self.item_manufacturer)):
+            if wanted != -1 and wanted != event[field] and wanted != event.get("previous_" + field):
+                return False
+        return True
+
+    def push(self, event):
+        if event["op"] == "reset":
+            self.reset()
+            return
+        if self.overflowed or not self.matches(event):
+            #a client which is starting again will see this change anyway
+            return
+
+        self.pending.pop(event["id"], None)
+        self.pending[event["id"]] = event
+
+        #the client has fallen too far behind. rather than keep every change for it,
+        #tell it to start again from the current catalog
+        if len(self.pending) > self.limit:
+            self.reset()
+        self.ready.set()
+
+    def reset(self):
+        self.pending = {}
+        self.overflowed = True
+        self.ready.set()
+
+    def close(self):
+        self.closed = True
+        self.ready.set()
+
+    async def next_events(self, timeout: float):
+        #events waiting to be sent. empty if there were none before timeout, or None once closed
+        try:
+            await asyncio.wait_for(self.ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return []
+        self.ready.clear()
+
+        if self.closed:
+            return None
+        if self.overflowed:
+            self.overflowed = False
+            return [{"op" : "reset"}]
+
+        events = list(self.pending.values())
+        self.pending = {}
+        return events
+
+
+class ChangeFeed:
+    def __init__(self, limit: int):
+        #most listings with changes waiting to be sent to each client
+        self.limit = limit
+        self.subscribers = set()
+
+    def publish(self, event):
+        for subscriber in self.subscribers:
+            subscriber.push(event)
+
+    def subscribe(self, item_category: int, item_manufacturer: int) -> FeedSubscriber:
+        subscriber = FeedSubscriber(item_category, item_manufacturer, self.limit)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: FeedSubscriber):
+        self.subscribers.discard(subscriber)
+
+    def close(self):
+        for subscriber in self.subscribers:
+            subscriber.close()
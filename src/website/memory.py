@@ -0,0 +1,84 @@
+import gc
+import sys
+import tracemalloc
+import types
+
+
+#objects which belong to the program rather than its data. following them would measure
+#everything reachable from the interpreter, as classes lead to their modules and methods to their owners
+SKIPPED_TYPES = (type, types.ModuleType, types.BuiltinFunctionType, types.MethodType, types.FrameType)
+
+
+def deep_size(obj, seen: set) -> int:
+    #bytes used by obj and everything it refers to, other than objects already in seen.
+    #objects measured are added to seen, so shared objects are only counted once
+    size = 0
+    stack = [obj]
+    while len(stack) > 0:
+        o = stack.pop()
+        if id(o) in seen or isinstance(o, SKIPPED_TYPES):
+            continue
+
+        seen.add(id(o))
+        size += sys.getsizeof(o)
+        if isinstance(o, types.FunctionType):
+            #only its code, such as that compiled from a template. its globals are a whole module
+            stack.append(o.__code__)
+        else:
+            stack.extend(gc.get_referents(o))
+    return size
+
+def measure(subsystems, seen: set = None) -> dict:
+    #approximate bytes used by each of (name, object) in turn. objects shared between them are
+    #counted against the first, so each figure is what that subsystem adds to those before it
+    seen = set() if seen is None else seen
+    return {name : deep_size(obj, seen) for name, obj in subsystems}
+
+
+class TracemallocSnapshots:
+    #number of frames kept for each allocation, and most allocations reported at once
+    FRAMES = 1
+    LIMIT = 25
+
+    def __init__(self):
+        self.snapshot = None
+
+    def take(self):
+        #start tracing if needed. allocations made before then can't be seen
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TracemallocSnapshots.FRAMES)
+
+        snapshot = tracemalloc.take_snapshot()
+        return snapshot.filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),))
+
+    def snapshot_top(self, limit: int = LIMIT) -> dict:
+        #the allocations which are using the most memory now. later diffs compare against this
+        self.snapshot = self.take()
+        return {
+            "traced_bytes" : tracemalloc.get_traced_memory()[0],
+            "top" : [TracemallocSnapshots.describe(stat) for stat in self.snapshot.statistics("lineno")[:limit]],
+        }
+
+    def diff(self, limit: int = LIMIT) -> dict:
+        #the allocations which have grown or shrunk the most since the last snapshot
+        if self.snapshot is None:
+            raise ValueError("No snapshot has been taken to compare with")
+
+        snapshot = self.take()
+        return {
+            "traced_bytes" : tracemalloc.get_traced_memory()[0],
+            "top" : [TracemallocSnapshots.describe(stat) for stat in snapshot.compare_to(self.snapshot, "lineno")[:limit]],
+        }
+
+    def stop(self):
+        self.snapshot = None
+        tracemalloc.stop()
+
+    @staticmethod
+    def describe(stat) -> dict:
+        frame = stat.traceback[0]
+        description = {"file" : frame.filename, "line" : frame.lineno, "size" : stat.size, "count" : stat.count}
+        if isinstance(stat, tracemalloc.StatisticDiff):
+            description["size_diff"] = stat.size_diff
+            description["count_diff"] = stat.count_diff
+        return description
@@ -0,0 +1,120 @@
+import argparse
+import base64
+import gzip
+import hashlib
+import mimetypes
+import os
+import urllib.request
+
+from aiohttp import web
+
+
+#third party assets kept under the static directory, with where they were downloaded from and
+#the integrity hash they must match. until they have been downloaded, pages use them from there
+VENDORED = {
+    "bootstrap/bootstrap.min.css" : (
+        "https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/css/bootstrap.min.css",
+        "sha384-QWTKZyjpPEjISv5WaRU9OFeRpok6YctnYmDr5pNlyT2bRjXh0JMhjY6hW+ALEwIH"
+    ),
+}
+
+
+class StaticAsset:
+    #compressing is only worth it for files at least this big, which shrink by at least this fraction
+    GZIP_MIN_SIZE = 256
+    GZIP_MIN_SAVING = 0.1
+
+    def __init__(self, name, data):
+        self.name = name
+        self.data = data
+        self.content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+
+        #the url changes whenever the content does, so it can be cached forever
+        self.digest = hashlib.sha256(data).hexdigest()[:16]
+        stem, extension = os.path.splitext(name)
+        self.hashed_name = f"{stem}.{self.digest}{extension}"
+
+        #compressed once, rather than for every response
+        self.gzipped = None
+        if len(data) >= StaticAsset.GZIP_MIN_SIZE:
+            gzipped = gzip.compress(data, mtime=0)
+            if len(gzipped) <= len(data) * (1 - StaticAsset.GZIP_MIN_SAVING):
+                self.gzipped = gzipped
+
+
+class StaticAssets:
+    #a year, which is as long as caches will keep anything
+    MAX_AGE = 365 * 24 * 60 * 60
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.assets = {}
+        self.by_hashed_name = {}
+
+        #everything is read once at startup. there are only a few small files
+        if not os.path.isdir(directory):
+            print(f"Website: Static assets directory \"{directory}\" not found. Serving pages without it...")
+            return
+
+        for root, _, files in os.walk(directory):
+            for file_name in files:
+                path = os.path.join(root, file_name)
+                name = os.path.relpath(path, directory).replace(os.sep, "/")
+                with open(path, "rb") as f:
+                    asset = StaticAsset(name, f.read())
+                self.assets[name] = asset
+                self.by_hashed_name[asset.hashed_name] = asset
+
+    def url(self, name):
+        if name in self.assets:
+            return f"/static/{self.assets[name].hashed_name}"
+        if name in VENDORED:
+            return VENDORED[name][0]
+        raise ValueError(f"No static asset named \"{name}\"")
+
+    async def handle(self, request):
+        asset = self.by_hashed_name.get(request.match_info["name"])
+        if asset is None:
+            raise web.HTTPNotFound()
+
+        headers = {
+            "Cache-Control" : f"public, max-age={StaticAssets.MAX_AGE}, immutable",
+            "ETag" : f"\"{asset.digest}\"",
+            "Vary" : "Accept-Encoding",
+        }
+        if request.headers.get("If-None-Match") == headers["ETag"]:
+            return web.Response(status=304, headers=headers)
+
+        body = asset.data
+        if asset.gzipped is not None and "gzip" in request.headers.get("Accept-Encoding", ""):
+            body = asset.gzipped
+            headers["Content-Encoding"] = "gzip"
+        return web.Response(body=body, content_type=asset.content_type, headers=headers)
+
+
+def vendor(directory):
+    #download the third party assets, checking each is exactly what the pages expect
+    for name, (url, integrity) in VENDORED.items():
+        with urllib.request.urlopen(url) as response:
+            data = response.read()
+
+        algorithm, expected = integrity.split("-", 1)
+        actual = base64.b64encode(hashlib.new(algorithm, data).digest()).decode("ascii")
+        if actual != expected:
+            raise ValueError(f"\"{url}\" does not match its integrity hash")
+
+        path = os.path.join(directory, *name.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+        print(f"Saved {url} to {path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+                    prog='Vendor static assets',
+                    description='Downloads the third party assets used by the website, so that it can be served without them.',
+                    )
+    parser.add_argument("--static-path", default="Resources/static/")
+    args = parser.parse_args()
+    vendor(args.static_path)
@@ -1,23 +1,101 @@
+import asyncio
+import datetime
+import json
+import time
+
 import aiohttp_jinja2
 import jinja2
 
 from aiohttp import web
 from listingmanager import Listing, ListingManager
+from .admission import AdmissionControl
+from .feed import ChangeFeed
+from .memory import TracemallocSnapshots, measure
+from .static import StaticAssets
 
 
 class Website(web.Application):
-    def __init__(self, templates_path, *args, **kwargs):
+    #number of listings parsed between each chance for other requests to be handled
+    LOAD_BATCH_SIZE = 200
+
+    #number of search results shown on each page
+    RESULTS_PER_PAGE = 50
+    SORT_KEYS = ["name", "quantity", "category", "manufacturer"]
+
+    #number of names suggested while a search is typed
+    AUTOCOMPLETE_LIMIT = 10
+
+    #most searches which can be made in one batch
+    BATCH_SEARCH_LIMIT = 200
+
+    #most listings with changes waiting to be sent to one client of the change feed, seconds
+    #between messages which keep feed connections open, and seconds between checks for
+    #changes made by other processes while anyone is listening
+    FEED_PENDING_LIMIT = 500
+    FEED_KEEPALIVE = 15
+    FEED_REFRESH_INTERVAL = 1
+
+    #seconds between syncing writes to disk, when the catalog is only synced periodically
+    FLUSH_INTERVAL = 1
+
+    #seconds between checks for listing files changed by other tools, when they are watched
+    WATCH_INTERVAL = 2
+
+    #changes are saved before they are answered, which holds up every other request. so that
+    #a burst of them can't take the whole server down, only a few are handled at once and a
+    #limited number may wait. the rest are told to retry after a while. each kind of change
+    #must be finished within a number of seconds, including any time spent waiting
+    MUTATIONS_IN_FLIGHT = 4
+    MUTATION_QUEUE_LIMIT = 64
+    MUTATION_RETRY_AFTER = 1
+    MUTATION_TIMEOUTS = {
+        "/stock_removed" : 5,
+        "/stock_added" : 5,
+        "/listing_created" : 10,
+        "/listing_removed" : 10,
+        "/listing_updated" : 10,
+        "/vocabulary_created" : 10,
+    }
+
+    def __init__(self, templates_path, static_path = "Resources/static/", *args, **kwargs):
         super().__init__(*args, **kwargs)
         
         aiohttp_jinja2.setup(self, loader=jinja2.FileSystemLoader(templates_path))
+        self.admission = AdmissionControl(Website.MUTATIONS_IN_FLIGHT, Website.MUTATION_QUEUE_LIMIT)
+        self.middlewares.append(self.admit_mutations)
+        self.middlewares.append(self.refresh_catalog)
+
+        #stylesheets and scripts are served from here rather than a cdn, under urls which
+        #change with their content, so browsers never need to ask for them twice
+        self.static = StaticAssets(static_path)
+        aiohttp_jinja2.get_env(self).globals["static_url"] = self.static.url
+
+        #a read-only catalog can still be searched, but every page that changes it is rejected
+        self.read_only = ListingManager.is_read_only()
+        aiohttp_jinja2.get_env(self).globals["read_only"] = self.read_only
+
         routes = [
             web.get('/', self.g_index),
             web.get('/help', self.g_help),
+            web.get('/ready', self.g_ready),
+            web.get('/metrics', self.g_metrics),
+            web.get('/admin/memory', self.g_memory),
+            web.post('/admin/memory/snapshot', self.p_memory_snapshot),
+            web.get('/admin/memory/diff', self.g_memory_diff),
+            web.post('/admin/memory/stop', self.p_memory_stop),
+            web.get('/dashboard', self.g_dashboard),
+            web.get('/low_stock', self.g_low_stock),
+            web.get('/history', self.g_history),
 
 
             web.get('/search', self.g_search),
             web.get('/search_results', self.g_search_results),
-
+            web.get('/autocomplete', self.g_autocomplete),
+            web.post('/batch_search', self.p_batch_search),
+            web.get('/changes', self.g_changes),
+            web.get('/static/{name:.+}', self.static.handle),
+        ]
+        mutation_routes = [
             web.get('/remove_stock', self.g_remove_stock),
             web.post('/stock_removed', self.p_stock_removed),
 
@@ -33,12 +111,156 @@ class Website(web.Application):
 
             web.get('/update_listing', self.g_update_listing),
             web.post('/listing_updated', self.p_listing_updated),
+
+            web.get('/create_vocabulary', self.g_create_vocabulary),
+            web.post('/vocabulary_created', self.p_vocabulary_created),
         ]
 
+        if self.read_only:
+            mutation_routes = [web.route(r.method, r.path, self.reject_mutation) for r in mutation_routes]
+
         self.add_routes(routes)
+        self.add_routes(mutation_routes)
+
+        self.on_startup.append(self.start_loading)
+        self.on_cleanup.append(self.stop_loading)
+
+        self.feed = ChangeFeed(Website.FEED_PENDING_LIMIT)
+        self.snapshots = TracemallocSnapshots()
+        self.on_startup.append(self.start_feed)
+        self.on_shutdown.append(self.close_feed)
+        self.on_cleanup.append(self.stop_feed)
+
+        self.on_startup.append(self.start_flushing)
+        self.on_cleanup.append(self.stop_flushing)
+
+        if ListingManager.is_watching():
+            self.on_startup.append(self.start_watching)
+            self.on_cleanup.append(self.stop_watching)
+
+
+    def preload_templates(self):
+        #templates are otherwise compiled when first rendered, which slows the first requests.
+        #returns the number compiled
+        env = aiohttp_jinja2.get_env(self)
+        names = [name for name in env.list_templates() if not " - old" in name]
+        for name in names:
+            env.get_template(name)
+        return len(names)
+
+
+    #region Background tasks
+    async def start_loading(self, app):
+        #finish loading the catalog without holding up requests for listings that are ready
+        self.loader = asyncio.create_task(self.load_catalog())
+
+    async def stop_loading(self, app):
+        self.loader.cancel()
+
+    async def load_catalog(self):
+        while not ListingManager.load_pending(Website.LOAD_BATCH_SIZE):
+            await asyncio.sleep(0)
+
+    async def start_feed(self, app):
+        ListingManager.add_listener(self.feed.publish)
+        self.feed_refresher = asyncio.create_task(self.refresh_feed())
+
+    async def close_feed(self, app):
+        #feed connections never finish by themselves
+        self.feed.close()
+
+    async def stop_feed(self, app):
+        self.feed_refresher.cancel()
+        ListingManager.remove_listener(self.feed.publish)
+
+    async def refresh_feed(self):
+        #changes made by other processes are usually picked up when a request is handled.
+        #feed clients shouldn't have to wait for someone else to make a request
+        while True:
+            await asyncio.sleep(Website.FEED_REFRESH_INTERVAL)
+            if len(self.feed.subscribers) > 0:
+                ListingManager.refresh()
+
+    async def start_flushing(self, app):
+        self.flusher = asyncio.create_task(self.flush_writes())
+
+    async def stop_flushing(self, app):
+        self.flusher.cancel()
+        ListingManager.flush()
+
+    async def flush_writes(self):
+        #writes are synced as more are made, but the last few shouldn't wait for the next one
+        while True:
+            await asyncio.sleep(Website.FLUSH_INTERVAL)
+            ListingManager.flush()
+
+    async def start_watching(self, app):
+        self.watcher = asyncio.create_task(self.watch_files())
+
+    async def stop_watching(self, app):
+        self.watcher.cancel()
+
+    async def watch_files(self):
+        #there may be very many listing files, so they are polled on another thread. only
+        #the changes found are applied here
+        while True:
+            await asyncio.sleep(Website.WATCH_INTERVAL)
+            names = ListingManager.watched_files()
+            stats = await asyncio.get_running_loop().run_in_executor(None, ListingManager.stat_files, names)
+            ListingManager.check_files(stats)
+
+    #endregion
+
+
+    #region Middleware
+    @web.middleware
+    async def admit_mutations(self, request, handler):
+        timeout = Website.MUTATION_TIMEOUTS.get(request.path)
+        if request.method != "POST" or timeout is None:
+            return await handler(request)
+
+        retry_after = {"Retry-After" : str(Website.MUTATION_RETRY_AFTER)}
+        try:
+            response = await self.admission.run(handler, request, timeout)
+        except asyncio.TimeoutError:
+            raise web.HTTPServiceUnavailable(reason="The change took too long. It may not have been made", headers=retry_after)
+        
+        if response is None:
+            raise web.HTTPServiceUnavailable(reason="Too many changes are waiting to be made", headers=retry_after)
+        return response
+
+    @web.middleware
+    async def refresh_catalog(self, request, handler):
+        #pick up changes made by other processes before handling the request
+        ListingManager.refresh()
+        Listing.reload_vocabularies()
+        return await handler(request)
+    
+    #endregion
 
 
     #region Pages    
+    @staticmethod
+    def find_listing(params, name_key = "item_name"):
+        #listings are addressed by id. names are still accepted so that older links keep working
+        try:
+            if "item_id" in params:
+                index = ListingManager.get_listing_index_by_id(int(params["item_id"]))
+            else:
+                index = ListingManager.get_listing_index(params[name_key])
+        except KeyError:
+            #missing values. can't find the listing!
+            raise web.HTTPBadRequest(reason="Incomplete request")
+        except ValueError:
+            raise web.HTTPBadRequest(reason="Non-integer where integer expected")
+        
+        if index == -1:
+            raise web.HTTPBadRequest(reason="Listing does not exist")
+        return index
+
+    async def reject_mutation(self, request):
+        raise web.HTTPForbidden(reason="This server is read-only")
+
     async def g_index(self, request):
         context = dict()
         response = aiohttp_jinja2.render_template('index.html.j2',
@@ -52,40 +274,264 @@ class Website(web.Application):
                                                 request,
                                                 context)
         return response
+
+    async def g_ready(self, request):
+        loaded, total = ListingManager.load_progress()
+        ready = ListingManager.is_loaded()
+        return web.json_response(
+            {"ready" : ready, "loaded" : loaded, "total" : total}, 
+            status = 200 if ready else 503
+        )
+    
+    async def g_metrics(self, request):
+        loaded, total = ListingManager.load_progress()
+        return web.json_response({
+            "mutations" : self.admission.metrics(),
+            "feed_subscribers" : len(self.feed.subscribers),
+            "listings_loaded" : loaded,
+            "listings_total" : total,
+        })
+    
+    async def g_memory(self, request):
+        #this visits every object in the catalog, which takes seconds for large ones. it only
+        #reads them, so it is done in another thread to let other requests carry on meanwhile
+        sizes = await asyncio.get_running_loop().run_in_executor(None, self.measure_memory)
+        return web.json_response({"bytes" : sizes, "total" : sum(sizes.values())})
+
+    def measure_memory(self):
+        #approximate bytes held by each part of the server
+        env = aiohttp_jinja2.get_env(self)
+        seen = {id(self)} #the templates can reach the whole website through the app global
+        sizes = measure(ListingManager.memory_subsystems(), seen)
+
+        #templates refer back to the environment, which is measured separately
+        seen.add(id(env))
+        sizes.update(measure([("jinja_template_cache", env.cache)], seen))
+        seen.discard(id(env))
+        sizes.update(measure([
+            ("jinja_environment", env),
+            ("static_assets", self.static.assets),
+            ("feed", self.feed.subscribers),
+        ], seen))
+        return sizes
+
+    async def p_memory_snapshot(self, request):
+        return web.json_response(self.snapshots.snapshot_top(Website.memory_report_limit(request)))
+
+    async def g_memory_diff(self, request):
+        try:
+            return web.json_response(self.snapshots.diff(Website.memory_report_limit(request)))
+        except ValueError as e:
+            raise web.HTTPBadRequest(reason=str(e))
+
+    async def p_memory_stop(self, request):
+        self.snapshots.stop()
+        return web.json_response({"tracing" : False})
+
+    @staticmethod
+    def memory_report_limit(request):
+        try:
+            return max(1, int(request.query.get("limit", TracemallocSnapshots.LIMIT)))
+        except ValueError:
+            raise web.HTTPBadRequest(reason="Non-integer where integer expected")
+    
+    async def g_dashboard(self, request):
+        context = {
+            "summary" : ListingManager.get_inventory_summary(),
+            "categories" : Listing.categories, 
+            "manufacturers" : Listing.manufacturers 
+        }
+        response = aiohttp_jinja2.render_template('dashboard.html.j2',
+                                                request,
+                                                context)
+        return response
+    
+    async def g_low_stock(self, request):
+        try:
+            threshold = int(request.query.get("threshold", 5))
+            item_category = int(request.query.get("item_category", -1))
+            item_manufacturer = int(request.query.get("item_manufacturer", -1))
+            page = max(1, int(request.query.get("page", 1)))
+        except ValueError:
+            raise web.HTTPBadRequest(reason="Non-integer value passed where integer required")
+        
+        #both lists are paged together. one extra result is requested to find out if there is another page
+        offset = (page - 1) * Website.RESULTS_PER_PAGE
+        results = ListingManager.get_listings_below(threshold, item_category, item_manufacturer, offset, Website.RESULTS_PER_PAGE + 1)
+        reorder = ListingManager.get_listings_to_reorder(offset, Website.RESULTS_PER_PAGE + 1)
+        has_next_page = len(results) > Website.RESULTS_PER_PAGE or len(reorder) > Website.RESULTS_PER_PAGE
+
+        context = {
+            "threshold" : threshold,
+            "param_item_category_id" : item_category,
+            "param_item_manufacturer_id" : item_manufacturer,
+            "page" : page,
+            "has_next_page" : has_next_page,
+            "results" : [l.as_dict() for l in results[:Website.RESULTS_PER_PAGE]],
+            "reorder" : [l.as_dict() for l in reorder[:Website.RESULTS_PER_PAGE]],
+            "categories" : Listing.categories, 
+            "manufacturers" : Listing.manufacturers 
+        }
+        response = aiohttp_jinja2.render_template('low_stock.html.j2',
+                                                request,
+                                                context)
+        return response
+    
+    async def g_history(self, request):
+        listing = ListingManager.get_listing(Website.find_listing(request.rel_url.query))
+        try:
+            days = int(request.query.get("days", 7))
+        except ValueError:
+            raise web.HTTPBadRequest(reason="Non-integer value passed where integer required")
+        
+        movements = ListingManager.get_stock_history(listing.id, time.time() - days * 24 * 60 * 60)
+        for movement in movements:
+            movement["time"] = datetime.datetime.fromtimestamp(movement["time"]).strftime("%Y-%m-%d %H:%M:%S")
+
+        context = {
+            "item_id" : listing.id,
+            "item_name" : listing.name,
+            "quantity" : listing.quantity,
+            "days" : days,
+            "movements" : movements
+        }
+        response = aiohttp_jinja2.render_template('history.html.j2',
+                                                request,
+                                                context)
+        return response
     
     async def g_search(self, request):
         context = { 
             "categories" : Listing.categories, 
-            "manufacturers" : Listing.manufacturers 
+            "manufacturers" : Listing.manufacturers,
+            "sort_keys" : Website.SORT_KEYS
         }
         response = aiohttp_jinja2.render_template('search.html.j2',
                                                 request,
                                                 context)
         return response
     
+    async def g_autocomplete(self, request):
+        prefix = request.query.get("prefix", "")
+        try:
+            limit = min(Website.AUTOCOMPLETE_LIMIT, int(request.query.get("limit", Website.AUTOCOMPLETE_LIMIT)))
+        except ValueError:
+            raise web.HTTPBadRequest(reason="Non-integer value passed where integer required")
+        
+        return web.json_response({"prefix" : prefix, "names" : ListingManager.autocomplete(prefix, limit)})
+    
+    async def p_batch_search(self, request):
+        #extract each query from the json body
+        try:
+            request_json = await request.json()
+            queries = [
+                (str(q["item_name"]), int(q["item_category"]), int(q["item_manufacturer"]))
+                for q in request_json["queries"]
+            ]
+            limit = request_json.get("limit")
+            limit = None if limit is None else int(limit)
+        except json.JSONDecodeError:
+            raise web.HTTPBadRequest(reason="Request body is not valid JSON")
+        except (KeyError, TypeError, AttributeError):
+            raise web.HTTPBadRequest(reason="Search parameters not supplied")
+        except ValueError:
+            raise web.HTTPBadRequest(reason="Non-integer value passed where integer required")
+        if len(queries) > Website.BATCH_SEARCH_LIMIT:
+            raise web.HTTPBadRequest(reason=f"No more than {Website.BATCH_SEARCH_LIMIT} searches can be made at once")
+        if limit is not None and limit < 1:
+            raise web.HTTPBadRequest(reason="Limit must be at least 1")
+        
+        results = ListingManager.batch_query_listings(queries, limit)
+        return web.json_response({"results" : [
+            {
+                "item_name" : item_name,
+                "item_category" : item_category,
+                "item_manufacturer" : item_manufacturer,
+                "listings" : [l.as_dict() for l in results[(item_name, item_category, item_manufacturer)]]
+            }
+            for item_name, item_category, item_manufacturer in queries
+        ]})
+    
+    async def g_changes(self, request):
+        #a stream of server-sent events, one for each change to a listing in the category
+        #and manufacturer given (if any)
+        try:
+            item_category = int(request.query.get("item_category", -1))
+            item_manufacturer = int(request.query.get("item_manufacturer", -1))
+        except ValueError:
+            raise web.HTTPBadRequest(reason="Non-integer value passed where integer required")
+
+        response = web.StreamResponse(headers={"Content-Type" : "text/event-stream", "Cache-Control" : "no-cache"})
+        await response.prepare(request)
+
+        subscriber = self.feed.subscribe(item_category, item_manufacturer)
+        try:
+            while True:
+                events = await subscriber.next_events(Website.FEED_KEEPALIVE)
+                if events is None:
+                    break
+                
+                if len(events) == 0:
+                    message = ": keepalive\n\n"
+                else:
+                    message = "".join(f"data: {json.dumps(e, separators=(',', ':'))}\n\n" for e in events)
+
+                #waits while a slow client catches up. its changes are combined in the meantime
+                await response.write(message.encode("utf-8"))
+        except ConnectionResetError:
+            pass
+        finally:
+            self.feed.unsubscribe(subscriber)
+
+        return response
+    
     async def g_search_results(self, request):
         #extract the search parameters from the request url
         try:
             item_name = request.query["item_name"]
             item_category = int(request.query["item_category"])
             item_manufacturer = int(request.query["item_manufacturer"])
+
+            #ordering and paging are optional
+            sort_key = request.query.get("sort", "name")
+            descending = request.query.get("order", "asc") == "desc"
+            page = max(1, int(request.query.get("page", 1)))
+            fuzzy = request.query.get("fuzzy", "") != ""
         except KeyError:
             raise web.HTTPBadRequest(reason="Search parameters not supplied")
         except ValueError:
             raise web.HTTPBadRequest(reason="Non-integer value passed where integer required")
+        if not sort_key in Website.SORT_KEYS:
+            raise web.HTTPBadRequest(reason="Unknown sort order")
         
-        results = ListingManager.query_listings(item_name, item_category, item_manufacturer)
+        results, facets = ListingManager.query_listings_with_facets(
+            item_name, item_category, item_manufacturer, sort_key, descending, 
+            (page - 1) * Website.RESULTS_PER_PAGE, Website.RESULTS_PER_PAGE + 1, fuzzy
+        )
+
+        #one extra result is requested to find out if there is another page
+        has_next_page = len(results) > Website.RESULTS_PER_PAGE
+        results = results[:Website.RESULTS_PER_PAGE]
 
 
         category_name = Listing.categories[item_category] if item_category != -1 else "Any Category"
         manufacturer_name = Listing.manufacturers[item_manufacturer] if item_manufacturer != -1 else "Any Manufacturer"
         context = { 
             "param_item_name" : item_name, 
+            "param_item_category_id" : item_category,
+            "param_item_manufacturer_id" : item_manufacturer,
+            "param_sort" : sort_key,
+            "param_order" : "desc" if descending else "asc",
+            "param_fuzzy" : fuzzy,
+            "page" : page,
+            "has_next_page" : has_next_page,
             "param_item_category" : category_name,
             "param_item_manufacturer" : manufacturer_name,
             "categories" : Listing.categories, 
             "manufacturers" : Listing.manufacturers,
-            "results" : [l.as_dict() for l in results] 
+            "results" : [l.as_dict() for l in results],
+            "facets" : facets,
+            "load_progress" : None if ListingManager.is_loaded() else ListingManager.load_progress()
         }
         response = aiohttp_jinja2.render_template('search_results.html.j2',
                                                 request,
@@ -94,14 +540,9 @@ class Website(web.Application):
 
 
     async def g_remove_stock(self, request):
-        #extract the name 
-        try:
-            name = request.rel_url.query["item_name"]
-        except KeyError:
-            #missing values. can't create the listing!
-            raise web.HTTPBadRequest(reason="Incomplete request")
+        listing = ListingManager.get_listing(Website.find_listing(request.rel_url.query))
         
-        context = {"item_name" : name}
+        context = {"item_id" : listing.id, "item_name" : listing.name}
         response = aiohttp_jinja2.render_template('remove_stock.html.j2',
                                                 request,
                                                 context)
@@ -111,7 +552,6 @@ class Website(web.Application):
         #extract the name and change in quantity
         params = await request.post()
         try:
-            name = params["item_name"]
             quantity = int(params["quantity"])
         except KeyError:
             #missing values. can't create the listing!
@@ -120,9 +560,7 @@ class Website(web.Application):
             #non-integer category or manufacturer
             raise web.HTTPBadRequest(reason="Non-integer where integer expected")
         
-        index = ListingManager.get_listing_index(name)
-        if index == -1:
-            raise web.HTTPBadRequest(reason="Listing does not exist")
+        index = Website.find_listing(params)
         if not ListingManager.remove_stock(index, quantity):
             raise web.HTTPBadRequest(reason="Insufficient stock")
 
@@ -134,14 +572,9 @@ class Website(web.Application):
     
 
     async def g_add_stock(self, request):
-        #extract the name 
-        try:
-            name = request.rel_url.query["item_name"]
-        except KeyError:
-            #missing values. can't create the listing!
-            raise web.HTTPBadRequest(reason="Incomplete request")
+        listing = ListingManager.get_listing(Website.find_listing(request.rel_url.query))
         
-        context = {"item_name" : name}
+        context = {"item_id" : listing.id, "item_name" : listing.name}
         response = aiohttp_jinja2.render_template('add_stock.html.j2',
                                                 request,
                                                 context)
@@ -151,7 +584,6 @@ class Website(web.Application):
         #extract the name and change in quantity
         request_json = await request.post()
         try:
-            name = request_json["item_name"]
             quantity = int(request_json["quantity"])
         except KeyError:
             #missing values. can't create the listing!
@@ -160,9 +592,7 @@ class Website(web.Application):
             #non-integer category or manufacturer
             raise web.HTTPBadRequest(reason="Non-integer where integer expected")
         
-        index = ListingManager.get_listing_index(name)
-        if index == -1:
-            raise web.HTTPBadRequest(reason="Listing does not exist")
+        index = Website.find_listing(request_json)
         if not ListingManager.add_stock(index, quantity):
             raise web.HTTPBadRequest(reason="Insufficient stock")
 
@@ -216,14 +646,9 @@ class Website(web.Application):
     
 
     async def g_remove_listing(self, request):
-        #extract the name 
-        try:
-            name = request.rel_url.query["item_name"]
-        except KeyError:
-            #missing values. can't create the listing!
-            raise web.HTTPBadRequest(reason="Incomplete request")
+        listing = ListingManager.get_listing(Website.find_listing(request.rel_url.query))
         
-        context = {"item_name" : name}
+        context = {"item_id" : listing.id, "item_name" : listing.name}
         response = aiohttp_jinja2.render_template('remove_listing.html.j2',
                                                 request,
                                                 context)
@@ -232,16 +657,7 @@ class Website(web.Application):
     async def p_listing_removed(self, request):
         #extract the name and change in quantity
         params = await request.post()
-        try:
-            name = params["item_name"]
-        except KeyError:
-            #missing values. can't create the listing!
-            raise web.HTTPBadRequest(reason="Incomplete request")
-        
-        index = ListingManager.get_listing_index(name)
-        if index == -1:
-            raise web.HTTPBadRequest(reason="Listing does not exist")
-        ListingManager.remove_listing(index)
+        ListingManager.remove_listing(Website.find_listing(params))
         
         context = dict()
         response = aiohttp_jinja2.render_template('listing_removed.html.j2',
@@ -251,23 +667,15 @@ class Website(web.Application):
     
 
     async def g_update_listing(self, request):
-        #extract the name 
-        try:
-            name = request.rel_url.query["item_name"]
-        except KeyError:
-            #missing values. can't create the listing!
-            raise web.HTTPBadRequest(reason="Incomplete request")
-        
-        index = ListingManager.get_listing_index(name)
-        if index == -1:
-            raise web.HTTPBadRequest(reason="Listing does not exist")
-        listing = ListingManager.get_listing(index)
+        listing = ListingManager.get_listing(Website.find_listing(request.rel_url.query))
         
         context = {
-            "item_name" : name,
+            "item_id" : listing.id,
+            "item_name" : listing.name,
             "item_desc" : listing.description,
             "item_category" : listing.category,
             "item_manufacturer" : listing.manufacturer,
+            "item_reorder_threshold" : listing.reorder_threshold,
             "categories" : Listing.categories,
             "manufacturers" : Listing.manufacturers
         }
@@ -280,11 +688,14 @@ class Website(web.Application):
         #extract the name and change in quantity
         params = await request.post()
         try:
-            name = params["item_old_name"]
             new_name = params["item_new_name"]
             new_description = params["item_new_desc"]
             new_category = int(params["item_new_category"])
             new_manufacturer = int(params["item_new_manufacturer"])
+            
+            #a blank reorder threshold means the listing is never due for reorder
+            new_reorder_threshold = params.get("item_new_reorder_threshold", "").strip()
+            new_reorder_threshold = int(new_reorder_threshold) if new_reorder_threshold != "" else None
         except KeyError:
             #missing values. can't create the listing!
             raise web.HTTPBadRequest(reason="Incomplete request")
@@ -292,10 +703,14 @@ class Website(web.Application):
             #non-integer category or manufacturer
             raise web.HTTPBadRequest(reason="Non-integer where integer expected")
         
-        index = ListingManager.get_listing_index(name)
-        if index == -1:
-            raise web.HTTPBadRequest(reason="Listing does not exist")
-        ListingManager.update_listing(index, new_name, new_description, new_category, new_manufacturer)
+        if new_reorder_threshold is not None and new_reorder_threshold < 0:
+            raise web.HTTPBadRequest(reason="Reorder threshold cannot be negative")
+        
+        #the threshold is changed along with everything else, so it can't be applied to a
+        #different listing if this one has moved in the meantime
+        index = Website.find_listing(params, "item_old_name")
+        if not ListingManager.update_listing(index, new_name, new_description, new_category, new_manufacturer, new_reorder_threshold):
+            raise web.HTTPBadRequest(reason="Name must be unique")
         
         context = dict()
         response = aiohttp_jinja2.render_template('listing_updated.html.j2',
@@ -303,4 +718,38 @@ class Website(web.Application):
                                                 context)
         return response
     
+
+    async def g_create_vocabulary(self, request):
+        context = dict()
+        response = aiohttp_jinja2.render_template('create_vocabulary.html.j2',
+                                                request,
+                                                context)
+        return response
+
+    async def p_vocabulary_created(self, request):
+        #extract the vocabulary and the name to add to it
+        params = await request.post()
+        try:
+            vocabulary = params["vocabulary"]
+            name = params["name"]
+        except KeyError:
+            #missing values. can't add the name!
+            raise web.HTTPBadRequest(reason="Incomplete request")
+
+        try:
+            if vocabulary == "category":
+                Listing.add_category(name)
+            elif vocabulary == "manufacturer":
+                Listing.add_manufacturer(name)
+            else:
+                raise web.HTTPBadRequest(reason="Unknown vocabulary")
+        except ValueError:
+            raise web.HTTPBadRequest(reason="Name cannot be blank")
+
+        context = {"vocabulary" : vocabulary, "name" : name.strip()}
+        response = aiohttp_jinja2.render_template('vocabulary_created.html.j2',
+                                                request,
+                                                context)
+        return response
+    
     #endregion
\ No newline at end of file